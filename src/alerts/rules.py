@@ -1,14 +1,20 @@
 """智能预警规则引擎"""
 from datetime import datetime, timedelta
 from alerts.celery_config import celery_app
-from models import TaskModel, WorkerModel, PrescriptionModel, AlertModel
+from models import TaskModel, TaskStage, WorkerModel, PrescriptionModel, AlertModel
 from alerts.notifiers import send_alert
-from exts import db
-from app import app
+from services.task_service import TaskService
+from services.backlog_estimator import backlog_estimator
+from realtime.metrics_store import metrics_store
+from services.assignment_service import PHASE_LABELS
+from exts import db, read_only
 
 @celery_app.task(name='alerts.rules.run_alert_checks')
 def run_alert_checks():
     """执行所有预警检查（Celery定时任务）"""
+    # 在任务内导入应用，仅导入规则函数时（如查询计划检查）不会创建应用、启动推送线程
+    from app import app
+
     with app.app_context():
         try:
             check_timeout_tasks()
@@ -19,95 +25,100 @@ def run_alert_checks():
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
 
-def check_timeout_tasks():
-    """检查超时任务"""
-    now = datetime.utcnow()
-
-    # 收方超时(>30分钟)
-    timeout_receive_tasks = TaskModel.query.filter(
+def _without_open_alert(query, alert_type):
+    """排除已存在同类型未读告警的任务（反连接）"""
+    open_alert = db.session.query(AlertModel.alert_id).filter(
+        AlertModel.task_id == TaskModel.task_id,
+        AlertModel.type == alert_type,
+        AlertModel.is_read == False
+    ).exists()
+    return query.filter(~open_alert)
+
+def timeout_receive_query(now):
+    """收方超时(>30分钟)的任务：以处方创建时间计"""
+    query = db.session.query(
+        TaskModel.task_id, TaskModel.receive_worker_id, TaskModel.receive_worker_name
+    ).join(
+        PrescriptionModel, PrescriptionModel.prescription_id == TaskModel.prescription_id
+    ).filter(
+        TaskModel.stage == TaskStage.RECEIVE,
         TaskModel.receive_worker_id.isnot(None),
-        TaskModel.receive_time.is_(None),
-        TaskModel.status == '未完成'
-    ).all()
-
-    for task in timeout_receive_tasks:
-        prescription = PrescriptionModel.query.get(task.prescription_id)
-        if prescription and (now - prescription.date).total_seconds() > 1800:  # 30分钟
-            # 检查是否已经发送过相同告警
-            existing_alert = AlertModel.query.filter_by(
-                task_id=task.task_id,
-                type='timeout_receive',
-                is_read=False
-            ).first()
-
-            if not existing_alert:
-                send_alert(
-                    type='timeout_receive',
-                    level='high',
-                    message=f'任务 #{task.task_id} 收方阶段超时(>30分钟)，负责工人: {task.receive_worker_name}',
-                    task_id=task.task_id,
-                    worker_id=task.receive_worker_id
-                )
-
-    # 配方超时(>1小时)
-    timeout_formulate_tasks = TaskModel.query.filter(
-        TaskModel.receive_time.isnot(None),
-        TaskModel.form_time.is_(None),
+        PrescriptionModel.date < now - timedelta(minutes=30)
+    )
+    return _without_open_alert(query, 'timeout_receive')
+
+def timeout_formulate_query(now):
+    """配方超时(>1小时)的任务：以收方时间计"""
+    query = db.session.query(
+        TaskModel.task_id, TaskModel.form_worker_id, TaskModel.form_worker_name
+    ).filter(
+        TaskModel.stage == TaskStage.FORMULATE,
         TaskModel.form_worker_id.isnot(None),
-        TaskModel.status == '未完成'
-    ).all()
-
-    for task in timeout_formulate_tasks:
-        if (now - task.receive_time).total_seconds() > 3600:  # 1小时
-            existing_alert = AlertModel.query.filter_by(
-                task_id=task.task_id,
-                type='timeout_formulate',
-                is_read=False
-            ).first()
+        TaskModel.receive_time < now - timedelta(hours=1)
+    )
+    return _without_open_alert(query, 'timeout_formulate')
+
+def timeout_decoction_query(now):
+    """煎药超时(>2小时)的任务：以煎药开始时间计"""
+    query = db.session.query(
+        TaskModel.task_id, TaskModel.decoction_worker_id, TaskModel.decoction_worker_name
+    ).filter(
+        TaskModel.stage == TaskStage.DECOCTING,
+        TaskModel.decoction_start_time < now - timedelta(hours=2)
+    )
+    return _without_open_alert(query, 'timeout_decoction')
 
-            if not existing_alert:
-                send_alert(
-                    type='timeout_formulate',
-                    level='high',
-                    message=f'任务 #{task.task_id} 配方阶段超时(>1小时)，负责工人: {task.form_worker_name}',
-                    task_id=task.task_id,
-                    worker_id=task.form_worker_id
-                )
-
-    # 煎药超时(>2小时)
-    timeout_decoction_tasks = TaskModel.query.filter(
-        TaskModel.form_time.isnot(None),
-        TaskModel.decoction_start_time.isnot(None),
-        TaskModel.decoction_end_time.is_(None),
-        TaskModel.status == '未完成'
-    ).all()
+def check_timeout_tasks():
+    """检查超时任务
 
-    for task in timeout_decoction_tasks:
-        if (now - task.decoction_start_time).total_seconds() > 7200:  # 2小时
-            existing_alert = AlertModel.query.filter_by(
-                task_id=task.task_id,
-                type='timeout_decoction',
-                is_read=False
-            ).first()
+    每个阶段只执行一条查询，直接返回已超过阈值且没有未读同类告警的任务，
+    查询次数不随未完成任务数量增长。
+    """
+    now = datetime.utcnow()
 
-            if not existing_alert:
-                send_alert(
-                    type='timeout_decoction',
-                    level='high',
-                    message=f'任务 #{task.task_id} 煎药阶段超时(>2小时)，负责工人: {task.decoction_worker_name}',
-                    task_id=task.task_id,
-                    worker_id=task.decoction_worker_id
-                )
+    # 只取需要的列，避免send_alert提交后逐行刷新过期的ORM对象
+    with read_only():
+        receive_timeouts = timeout_receive_query(now).all()
+        formulate_timeouts = timeout_formulate_query(now).all()
+        decoction_timeouts = timeout_decoction_query(now).all()
+
+    for task_id, worker_id, worker_name in receive_timeouts:
+        send_alert(
+            type='timeout_receive',
+            level='high',
+            message=f'任务 #{task_id} 收方阶段超时(>30分钟)，负责工人: {worker_name}',
+            task_id=task_id,
+            worker_id=worker_id
+        )
+
+    for task_id, worker_id, worker_name in formulate_timeouts:
+        send_alert(
+            type='timeout_formulate',
+            level='high',
+            message=f'任务 #{task_id} 配方阶段超时(>1小时)，负责工人: {worker_name}',
+            task_id=task_id,
+            worker_id=worker_id
+        )
+
+    for task_id, worker_id, worker_name in decoction_timeouts:
+        send_alert(
+            type='timeout_decoction',
+            level='high',
+            message=f'任务 #{task_id} 煎药阶段超时(>2小时)，负责工人: {worker_name}',
+            task_id=task_id,
+            worker_id=worker_id
+        )
 
 def check_abnormal_fast_tasks():
     """检查异常快速完成的任务"""
     one_hour_ago = datetime.utcnow() - timedelta(hours=1)
 
-    fast_tasks = TaskModel.query.filter(
-        TaskModel.status == '完成',
-        TaskModel.decoction_end_time >= one_hour_ago,
-        TaskModel.receive_time.isnot(None)
-    ).all()
+    with read_only():
+        fast_tasks = TaskModel.query.filter(
+            TaskModel.status == '完成',
+            TaskModel.decoction_end_time >= one_hour_ago,
+            TaskModel.receive_time.isnot(None)
+        ).all()
 
     for task in fast_tasks:
         total_time = (task.decoction_end_time - task.receive_time).total_seconds()
@@ -126,10 +137,13 @@ def check_abnormal_fast_tasks():
                 )
 
 def check_task_backlog():
-    """检查任务积压"""
-    pending_count = TaskModel.query.filter_by(status='未完成').count()
+    """检查任务积压：以当前处理速度清空积压的预计时间超过 BACKLOG_SLA_MINUTES 时告警"""
+    with read_only():
+        # 告警在 Celery 进程中执行，进程内的看板计数没有增量更新，估计前先与数据库对账
+        metrics_store.reconcile()
+        estimate = backlog_estimator.estimate()
 
-    if pending_count > 10:  # 阈值可配置
+    if estimate['breached']:
         # 检查最近是否发送过积压告警（避免重复告警）
         recent_alert = AlertModel.query.filter(
             AlertModel.type == 'backlog',
@@ -138,67 +152,52 @@ def check_task_backlog():
         ).first()
 
         if not recent_alert:
+            bottleneck = estimate['phases'][estimate['bottleneck']]
+            if estimate['stalled']:
+                drain = f"近期没有完成{PHASE_LABELS[estimate['bottleneck']]}的任务，积压无法清空"
+            else:
+                drain = f"预计 {estimate['drain_minutes']:.0f} 分钟才能清空积压（超过 {estimate['sla_minutes']:.0f} 分钟）"
+            source = '，按预计耗时估计' if bottleneck['rate_source'] == 'expected' else ''
             send_alert(
                 type='backlog',
                 level='high',
-                message=f'待处理任务积压严重(当前 {pending_count} 单)，请增加人力或优化流程',
-                data={'pending_count': pending_count}
+                message=(f"待处理任务积压严重：{drain}（瓶颈{PHASE_LABELS[estimate['bottleneck']]}："
+                         f"待处理 {bottleneck['upstream']} 单，处理 {bottleneck['service_rate']:.1f} 单/小时{source}；"
+                         f"到达 {estimate['arrival_rate']:.1f} 单/小时），请增加人力或优化流程"),
+                data=estimate
             )
 
 def check_worker_efficiency():
     """检查工人效率"""
-    workers = WorkerModel.query.all()
-
-    # 计算平均效率
-    total_completed = 0
-    worker_count = 0
-    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-
-    for worker in workers:
-        completed = TaskModel.query.filter(
-            (
-                (TaskModel.receive_worker_id == worker.worker_id) |
-                (TaskModel.form_worker_id == worker.worker_id) |
-                (TaskModel.decoction_worker_id == worker.worker_id)
-            ),
-            TaskModel.status == '完成',
-            TaskModel.decoction_end_time >= today_start
-        ).count()
+    with read_only():
+        workers = db.session.query(WorkerModel.worker_id, WorkerModel.name).all()
+        if not workers:
+            return
 
-        total_completed += completed
-        worker_count += 1
+        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        completed_counts = TaskService.get_completed_counts_by_worker(today_start)
 
-    if worker_count == 0:
-        return
+    # 计算平均效率
+    avg_efficiency = sum(completed_counts.get(w.worker_id, 0) for w in workers) / len(workers)
 
-    avg_efficiency = total_completed / worker_count
+    # 今日已发送过未读低效告警的工人
+    alerted_workers = {
+        worker_id for (worker_id,) in db.session.query(AlertModel.worker_id).filter(
+            AlertModel.type == 'low_efficiency',
+            AlertModel.created_at >= today_start,
+            AlertModel.is_read == False
+        ).distinct()
+    }
 
     # 检查低效工人
     for worker in workers:
-        completed = TaskModel.query.filter(
-            (
-                (TaskModel.receive_worker_id == worker.worker_id) |
-                (TaskModel.form_worker_id == worker.worker_id) |
-                (TaskModel.decoction_worker_id == worker.worker_id)
-            ),
-            TaskModel.status == '完成',
-            TaskModel.decoction_end_time >= today_start
-        ).count()
-
-        if completed < avg_efficiency * 0.7:  # 低于平均70%
-            # 检查是否已发送告警
-            existing_alert = AlertModel.query.filter(
-                AlertModel.worker_id == worker.worker_id,
-                AlertModel.type == 'low_efficiency',
-                AlertModel.created_at >= today_start,
-                AlertModel.is_read == False
-            ).first()
+        completed = completed_counts.get(worker.worker_id, 0)
 
-            if not existing_alert:
-                percentage = (completed / avg_efficiency * 100) if avg_efficiency > 0 else 0
-                send_alert(
-                    type='low_efficiency',
-                    level='medium',
-                    message=f'工人 {worker.name} 今日效率异常(仅为平均的 {percentage:.0f}%)，已完成 {completed} 个任务',
-                    worker_id=worker.worker_id
-                )
+        if completed < avg_efficiency * 0.7 and worker.worker_id not in alerted_workers:  # 低于平均70%
+            percentage = (completed / avg_efficiency * 100) if avg_efficiency > 0 else 0
+            send_alert(
+                type='low_efficiency',
+                level='medium',
+                message=f'工人 {worker.name} 今日效率异常(仅为平均的 {percentage:.0f}%)，已完成 {completed} 个任务',
+                worker_id=worker.worker_id
+            )
@@ -1,14 +1,16 @@
 """FHIR RESTful API资源端点"""
 from flask_restful import Resource
 from flask import jsonify, request
+from sqlalchemy.orm import joinedload
 from models import PrescriptionModel, PatientModel, DoctorModel, TaskModel
 from api.fhir.serializers import FHIRSerializer
 from services.prescription_service import PrescriptionService
-from exts import db
+from exts import db, read_only
 
 class MedicationRequestResource(Resource):
     """FHIR MedicationRequest资源 (处方)"""
 
+    @read_only()
     def get(self, prescription_id=None):
         """获取处方资源"""
         if prescription_id:
@@ -56,6 +58,7 @@ class MedicationRequestResource(Resource):
 class PatientResource(Resource):
     """FHIR Patient资源 (患者)"""
 
+    @read_only()
     def get(self, patient_id=None):
         """获取患者资源"""
         if patient_id:
@@ -83,6 +86,7 @@ class PatientResource(Resource):
 class PractitionerResource(Resource):
     """FHIR Practitioner资源 (医生)"""
 
+    @read_only()
     def get(self, doctor_id=None):
         """获取医生资源"""
         if doctor_id:
@@ -110,23 +114,22 @@ class PractitionerResource(Resource):
 class TaskResource(Resource):
     """FHIR Task资源 (任务)"""
 
+    @read_only()
     def get(self, task_id=None):
         """获取任务资源"""
         if task_id:
             # 获取单个任务
             task = TaskModel.query.get_or_404(task_id)
-            prescription = PrescriptionModel.query.get(task.prescription_id)
-            fhir_resource = FHIRSerializer.task_to_fhir(task, prescription)
+            fhir_resource = FHIRSerializer.task_to_fhir(task, task.prescription)
             return jsonify(fhir_resource)
         else:
             # 获取所有任务(Bundle资源)
-            tasks = TaskModel.query.all()
+            tasks = TaskModel.query.options(joinedload(TaskModel.prescription)).all()
             entries = []
             for t in tasks:
-                prescription = PrescriptionModel.query.get(t.prescription_id)
                 entries.append({
                     "fullUrl": f"http://localhost:5050/fhir/Task/{t.task_id}",
-                    "resource": FHIRSerializer.task_to_fhir(t, prescription)
+                    "resource": FHIRSerializer.task_to_fhir(t, t.prescription)
                 })
 
             bundle = {
@@ -2,12 +2,13 @@ from flask import Flask, session
 from flask_restful import Api
 import config
 from exts import db
+from database import setup_database
 
 # 初始化应用
 app = Flask(__name__)
 app.config.from_object(config)
 
-db.init_app(app)
+setup_database(app)
 
 # 添加context processor以在所有模板中提供未读告警数量
 @app.context_processor
@@ -64,7 +65,9 @@ socketio = init_socketio(app)
 
 # 初始化数据库
 if __name__ == '__main__':
+    from migrations import run_migrations
     with app.app_context():
         db.create_all()  # 创建所有表
+        run_migrations()  # 执行未完成的结构迁移
     # 使用socketio.run代替app.run以支持WebSocket
     socketio.run(app, debug=True, host='0.0.0.0', port=5050, allow_unsafe_werkzeug=True)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+处方列表页查询次数检查
+在不同的处方规模下请求医生、患者处方列表的第一页与最后一页，统计每次页面请求执行的SQL语句数与耗时；
+语句数随处方数量增长（N+1查询）时以非零状态退出
+使用方法：python benchmarks/bench_prescription_lists.py [处方数 ...]
+"""
+
+import sys
+import time
+
+from flask import current_app
+
+from common import create_bench_app, QueryCounter
+from exts import db
+from services.prescription_service import PrescriptionService
+from models import PrescriptionModel, TaskModel, TaskStage, DoctorModel, PatientModel
+from blueprints.doctor import doctor_bp
+from blueprints.patient import patient_bp
+
+DEFAULT_SIZES = [10, 1000, 5000]
+
+PAGES = [
+    ('医生处方列表', '/doctor/prescriptions/', 'doctor'),
+    ('患者处方列表', '/patient/prescriptions/', 'patient'),
+]
+
+
+def create_app():
+    app = create_bench_app()
+    app.config['SECRET_KEY'] = 'bench'
+    app.register_blueprint(doctor_bp)
+    app.register_blueprint(patient_bp)
+
+    @app.context_processor
+    def inject_unread_alerts():
+        return dict(unread_alerts_count=0)
+
+    # 模板中的导航链接需要这些端点存在
+    app.add_url_rule('/dashboard/', 'auth.dashboard', lambda: '')
+    return app
+
+
+def seed_prescriptions(count):
+    """为同一医生、同一患者生成处方及任务，任务阶段轮流分布"""
+    doctor = DoctorModel(name='基准医生')
+    patient = PatientModel(name='基准患者')
+    db.session.add_all([doctor, patient])
+    db.session.flush()
+
+    prescriptions = [PrescriptionModel(patient_id=patient.patient_id, doctor_id=doctor.doctor_id, amount=1)
+                     for _ in range(count)]
+    db.session.add_all(prescriptions)
+    db.session.flush()
+
+    db.session.add_all([
+        TaskModel(prescription_id=p.prescription_id, stage=i % (TaskStage.COMPLETED + 1))
+        for i, p in enumerate(prescriptions)
+    ])
+    db.session.commit()
+
+    # 最后一页的游标：从最早的第 PRESCRIPTION_PAGE_SIZE+1 条处方之后开始
+    page_size = current_app.config.get('PRESCRIPTION_PAGE_SIZE', 20)
+    last_cursor = None
+    if count > page_size:
+        last_cursor = PrescriptionService.encode_cursor(prescriptions[page_size])
+    return {'doctor': doctor.doctor_id, 'patient': patient.patient_id}, last_cursor
+
+
+def request_page(client, url, **args):
+    started = time.perf_counter()
+    with QueryCounter(db.engine) as counter:
+        response = client.get(url, query_string=args)
+    elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} 返回 {response.status_code}")
+    return counter.count, elapsed * 1000
+
+
+def run_once(count):
+    app = create_app()
+    results = {}
+    with app.app_context():
+        db.create_all()
+        role_ids, last_cursor = seed_prescriptions(count)
+        client = app.test_client()
+
+        for name, url, role in PAGES:
+            with client.session_transaction() as session:
+                session.update(user_id='bench', role=role, role_id=role_ids[role])
+
+            first = request_page(client, url)
+            last = request_page(client, url, cursor=last_cursor) if last_cursor else first
+            results[name] = first + last
+
+        db.drop_all()
+    return results
+
+
+def main(sizes):
+    print(f"{'页面':<10} {'处方数':>8} {'首页语句数':>10} {'首页耗时ms':>10} {'末页语句数':>10} {'末页耗时ms':>10}")
+    counts = {}
+    for size in sizes:
+        for name, (first_count, first_ms, last_count, last_ms) in run_once(size).items():
+            counts.setdefault(name, set()).update((first_count, last_count))
+            print(f"{name:<10} {size:>8} {first_count:>10} {first_ms:>10.1f} {last_count:>10} {last_ms:>10.1f}")
+
+    growing = [name for name, values in counts.items() if len(values) > 1]
+    for name in growing:
+        print(f"⚠ {name} 的SQL语句数随处方数量变化")
+    return len(growing)
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES) else 0)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+超时告警规则基准测试
+在不同的未完成任务规模下运行 check_timeout_tasks，统计扫描 tasks 表的查询次数
+使用方法：python benchmarks/bench_timeout_rules.py [任务数 ...]
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+
+from common import create_bench_app, QueryCounter
+from exts import db
+from models import PrescriptionModel, TaskModel, TaskStage, WorkerModel, AlertModel
+from alerts.rules import check_timeout_tasks
+
+DEFAULT_SIZES = [100, 1000, 5000]
+
+
+def seed_tasks(task_count):
+    """按收方、配方、煎药三个阶段平均生成已超时的未完成任务"""
+    long_ago = datetime.utcnow() - timedelta(hours=3)
+    worker = WorkerModel(name='基准工人')
+    db.session.add(worker)
+    db.session.flush()
+
+    prescriptions = [PrescriptionModel(patient_id=1, doctor_id=1, amount=1, date=long_ago)
+                     for _ in range(task_count)]
+    db.session.add_all(prescriptions)
+    db.session.flush()
+
+    for i, prescription in enumerate(prescriptions):
+        task = TaskModel(prescription_id=prescription.prescription_id, status='未完成')
+        stage = i % 3
+        if stage == 0:
+            task.stage = TaskStage.RECEIVE
+            task.receive_worker_id = worker.worker_id
+            task.receive_worker_name = worker.name
+        elif stage == 1:
+            task.stage = TaskStage.FORMULATE
+            task.receive_time = long_ago
+            task.form_worker_id = worker.worker_id
+            task.form_worker_name = worker.name
+        else:
+            task.stage = TaskStage.DECOCTING
+            task.receive_time = long_ago
+            task.form_time = long_ago
+            task.decoction_worker_id = worker.worker_id
+            task.decoction_worker_name = worker.name
+            task.decoction_start_time = long_ago
+        db.session.add(task)
+    db.session.commit()
+
+
+def run_once(task_count):
+    app = create_bench_app()
+    with app.app_context():
+        db.create_all()
+        seed_tasks(task_count)
+
+        # 首次运行：所有任务均超时，需要逐条写入告警
+        started = time.perf_counter()
+        with QueryCounter(db.engine) as first:
+            check_timeout_tasks()
+        first_elapsed = time.perf_counter() - started
+        alerts = AlertModel.query.count()
+
+        # 稳定状态：告警均未读，不应再产生任何告警
+        started = time.perf_counter()
+        with QueryCounter(db.engine) as steady:
+            check_timeout_tasks()
+        steady_elapsed = time.perf_counter() - started
+
+        db.drop_all()
+
+    return {
+        'tasks': task_count,
+        'alerts': alerts,
+        'first_scans': first.matching('FROM tasks'),
+        'first_ms': first_elapsed * 1000,
+        'steady_scans': steady.matching('FROM tasks'),
+        'steady_total': steady.count,
+        'steady_ms': steady_elapsed * 1000,
+    }
+
+
+def main(sizes):
+    print(f"{'任务数':>8} {'告警数':>8} {'首次扫描查询':>12} {'首次耗时ms':>10} "
+          f"{'稳定扫描查询':>12} {'稳定总语句':>10} {'稳定耗时ms':>10}")
+    scans = set()
+    for size in sizes:
+        r = run_once(size)
+        scans.add((r['first_scans'], r['steady_scans']))
+        print(f"{r['tasks']:>8} {r['alerts']:>8} {r['first_scans']:>12} {r['first_ms']:>10.1f} "
+              f"{r['steady_scans']:>12} {r['steady_total']:>10} {r['steady_ms']:>10.1f}")
+
+    growing = len(scans) > 1
+    if growing:
+        print("⚠ 扫描 tasks 表的查询次数随任务数量变化")
+    return growing
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES) else 0)
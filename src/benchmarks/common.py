@@ -0,0 +1,64 @@
+"""基准测试公共工具"""
+import os
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+PROJECT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_DIR))
+
+from flask import Flask
+from sqlalchemy import event
+from exts import db
+
+
+def create_bench_app(database_uri=None):
+    """创建使用独立数据库的Flask应用
+
+    默认使用内存SQLite；设置 BENCH_DATABASE_URL（如一个专用的本地PostgreSQL库）可在其他数据库上运行，
+    基准脚本会在该库中建表并在结束时删除。
+    """
+    # 以项目目录为根目录，页面基准可以直接渲染 templates 中的模板
+    app = Flask(__name__, root_path=str(PROJECT_DIR))
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri or os.environ.get('BENCH_DATABASE_URL', 'sqlite://')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+class QueryCounter:
+    """统计代码块内执行的SQL语句
+
+    用法::
+
+        with QueryCounter(db.engine) as counter:
+            do_something()
+        print(counter.count, counter.matching('FROM tasks'))
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.parameters = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def matching(self, fragment):
+        """统计包含指定片段的SELECT语句数量"""
+        return sum(
+            1 for s in self.statements
+            if s.lstrip().upper().startswith('SELECT') and fragment in s
+        )
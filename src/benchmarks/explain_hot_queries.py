@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+热点查询执行计划检查
+执行看板指标与告警规则，捕获其中的 SELECT 语句并输出执行计划
+（SQLite 为 EXPLAIN QUERY PLAN，PostgreSQL 为 EXPLAIN），未使用索引的全表扫描以 ⚠ 标出，便于发现索引回退
+使用方法：python benchmarks/explain_hot_queries.py
+         BENCH_DATABASE_URL=postgresql+psycopg://... python benchmarks/explain_hot_queries.py
+"""
+
+import re
+import sys
+from datetime import datetime
+
+from common import create_bench_app, QueryCounter
+from exts import db
+from realtime.dashboard_metrics import DashboardMetrics
+from realtime.metrics_store import metrics_store
+from alerts import rules
+from services.prescription_service import PrescriptionService
+from services.task_service import TaskService
+from services.assignment_service import assignment_engine, AssignmentService
+from services.decoction_service import DecoctionService
+
+
+def prescription_page():
+    """医生处方列表的非首页（带游标与状态筛选）"""
+    cursor = f"{datetime.utcnow().isoformat()}_1"
+    PrescriptionService.get_prescriptions_by_doctor(1, cursor=cursor)
+    PrescriptionService.get_prescriptions_by_doctor(1, status='pending', cursor=cursor)
+
+
+def task_board_page():
+    """管理员任务看板的非首页（按阶段排序、阶段筛选、工人筛选）"""
+    TaskService.get_task_board(sort='stage', cursor='1_100')
+    TaskService.get_task_board(stage='pending', sort='-task_id', cursor='100')
+    TaskService.get_task_board(worker_id=1, sort='stage', cursor='1_100')
+
+
+def worker_queue():
+    """工人待办队列与已完成历史的非首页"""
+    TaskService.get_worker_queue(1)
+    TaskService.get_worker_history(1, cursor='100')
+
+
+HOT_PATHS = [
+    ('看板计数对账', metrics_store.reconcile),
+    ('完成趋势', DashboardMetrics.get_hourly_stats),
+    ('超时任务规则', rules.check_timeout_tasks),
+    ('异常快速完成规则', rules.check_abnormal_fast_tasks),
+    ('任务积压规则', rules.check_task_backlog),
+    ('工人效率规则', rules.check_worker_efficiency),
+    ('处方列表分页', prescription_page),
+    ('任务看板分页', task_board_page),
+    ('工人待办队列', worker_queue),
+    ('自动分配负载对账', assignment_engine.reconcile),
+    ('自动分配计划', AssignmentService.plan_backlog),
+    ('排队等待分配计数', AssignmentService.get_waiting_counts),
+    ('煎药排程', DecoctionService.get_schedule),
+]
+
+# 各方言的执行计划语句与全表扫描特征（临时B树、子查询物化等不计入）
+EXPLAIN_SYNTAX = {
+    'sqlite': ('EXPLAIN QUERY PLAN', re.compile(r'^SCAN (\w+)$')),
+    'postgresql': ('EXPLAIN', re.compile(r'Seq Scan on (\w+)')),
+}
+
+# 行数很少、允许整表读取的维表
+SMALL_TABLES = {'workers', 'decoction_pots'}
+
+
+def explain(conn, prefix, statement, parameters):
+    rows = conn.exec_driver_sql(f'{prefix} {statement}', parameters).all()
+    return [row[-1] for row in rows]
+
+
+def main():
+    app = create_bench_app()
+    full_scans = 0
+
+    with app.app_context():
+        db.create_all()
+        tables = set(db.metadata.tables)
+        prefix, full_scan = EXPLAIN_SYNTAX[db.engine.dialect.name]
+
+        for name, func in HOT_PATHS:
+            with QueryCounter(db.engine) as counter:
+                func()
+            # 热点路径可能提交或关闭会话连接，回滚后每条执行计划使用独立连接
+            db.session.rollback()
+
+            print(f"=== {name} ===")
+            seen = set()
+            for statement, parameters in zip(counter.statements, counter.parameters):
+                if not statement.lstrip().upper().startswith('SELECT') or statement in seen:
+                    continue
+                seen.add(statement)
+                print(' '.join(statement.split()))
+                with db.engine.connect() as conn:
+                    details = explain(conn, prefix, statement, parameters)
+                for detail in details:
+                    match = full_scan.search(detail)
+                    scanned = match and match.group(1) in tables and match.group(1) not in SMALL_TABLES
+                    if scanned:
+                        full_scans += 1
+                    print(f"    {'⚠ ' if scanned else ''}{detail}")
+                print()
+
+        db.drop_all()
+
+    print(f"全表扫描: {full_scans} 处")
+    return full_scans
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
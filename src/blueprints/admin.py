@@ -1,10 +1,29 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from models import UserModel, AdminModel, DoctorModel, WorkerModel, PatientModel, TaskModel, AlertModel
 from alerts.notifiers import mark_alert_read, resolve_alert, get_unread_alerts, get_recent_alerts
+from services.task_service import TaskService, TaskConflictError, WipLimitError, STAGE_FILTERS, parse_version
+from services.assignment_service import AssignmentService, assignment_engine, PHASE_LABELS
+from services.decoction_service import DecoctionService
 from exts import db
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
+# 回退阶段对应的提示文字
+ROLLBACK_TARGETS = {
+    'receive': '收方前',
+    'formulate': '配方前',
+    'decoction': '煎药前',
+}
+
+# 任务看板接口单页最大条数
+TASK_BOARD_MAX_LIMIT = 200
+
+# 自动分配每个工序单次最多处理的任务数
+AUTO_ASSIGN_MAX_LIMIT = 200
+
+# 煎药排程最多排入的待煎药任务数
+DECOCTION_SCHEDULE_LIMIT = 200
+
 @admin_bp.route('/dashboard')
 def dashboard():
     """管理员实时数据看板"""
@@ -69,6 +88,9 @@ def users():
             new_user = UserModel(username=username, password=password, role=role, role_id=role_id)
             db.session.add(new_user)
             db.session.commit()
+            if role == 'worker':
+                # 新工人加入自动分配的负载堆需要重新对账
+                assignment_engine.invalidate()
             flash(f"用户 {username} 添加成功! UUID: {new_user.uuid}, 角色: {role}, 角色ID: {role_id}", 'success')
 
         except Exception as e:
@@ -121,6 +143,9 @@ def delete_user(uuid):
 
             db.session.delete(user)
             db.session.commit()
+            if role == 'worker':
+                # 已删除的工人不能再被自动分配选中，负载堆需要重新对账
+                assignment_engine.invalidate()
             flash(f"用户 {user.username} 已成功删除", 'success')
         else:
             flash("未找到用户", 'danger')
@@ -139,6 +164,19 @@ def validate_username():
         return {'valid': False, 'message': f"用户名 {username} 已存在"}
     return {'valid': True, 'message': f"用户名 {username} 可用"}
 
+def _parse_wip_limit(phase, value):
+    """解析工人在该工序的在制任务上限：留空返回None（使用默认上限），否则须为不小于0的整数（0 为不限制）"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        raise ValueError(f'{PHASE_LABELS[phase]}进行中任务上限必须是不小于 0 的整数，留空表示使用默认上限!')
+    return limit
+
 @admin_bp.route('/users/edit/<uuid>', methods=['GET', 'POST'])
 def edit_user(uuid):
     if 'user_id' not in session or session.get('role') != 'admin':
@@ -153,6 +191,17 @@ def edit_user(uuid):
     admin = AdminModel.query.filter_by(admin_id=user.role_id).first() if user.role == 'admin' else None
 
     if request.method == 'POST':
+        # 先校验再修改，校验失败时不保存任何字段
+        wip_limits = {}
+        if user.role == 'worker' and worker:
+            try:
+                for phase in PHASE_LABELS:
+                    if f'worker_wip_limit_{phase}' in request.form:
+                        wip_limits[phase] = _parse_wip_limit(phase, request.form[f'worker_wip_limit_{phase}'])
+            except ValueError as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('admin.edit_user', uuid=uuid))
+
         user.username = request.form.get('username', user.username)
         user.password = request.form.get('password', user.password)
 
@@ -171,6 +220,11 @@ def edit_user(uuid):
             worker.name = request.form.get('worker_name', worker.name)
             worker.age = request.form.get('worker_age', worker.age)
             worker.contact_number = request.form.get('worker_contact', worker.contact_number)
+            if wip_limits:
+                # 留空表示使用默认上限；修改后自动分配的负载需要重新对账
+                for phase, limit in wip_limits.items():
+                    setattr(worker, f'wip_limit_{phase}', limit)
+                assignment_engine.invalidate()
         elif user.role == 'admin' and admin:
             admin.name = request.form.get('admin_name', admin.name)
             admin.contact_number = request.form.get('admin_contact', admin.contact_number)
@@ -179,7 +233,8 @@ def edit_user(uuid):
         flash(f"用户 {user.username} 更新成功!", 'success')
         return redirect(url_for('admin.users'))
 
-    return render_template('edit_user.html', user=user, patient=patient, doctor=doctor, worker=worker, admin=admin)
+    return render_template('edit_user.html', user=user, patient=patient, doctor=doctor, worker=worker, admin=admin,
+                           phase_labels=PHASE_LABELS)
 
 @admin_bp.route('/assign_tasks', methods=['GET', 'POST'])
 def assign_tasks():
@@ -195,26 +250,17 @@ def assign_tasks():
             worker_id = int(request.form.get('worker_id'))
             task_type = request.form.get('task_type')
 
-            task = TaskModel.query.get_or_404(task_id)
-            worker = WorkerModel.query.get_or_404(worker_id)
-
-            if task_type == 'formulate' and not task.receive_time:
-                return jsonify({'success': False, 'message': '必须完成收方后才能分配配方任务!'})
-
-            if task_type == 'decoction' and not task.form_time:
-                return jsonify({'success': False, 'message': '必须完成配方后才能分配煎药任务!'})
-
-            if task_type == 'receive':
-                task.receive_worker_id = worker_id
-                task.receive_worker_name = worker.name
-            elif task_type == 'formulate':
-                task.form_worker_id = worker_id
-                task.form_worker_name = worker.name
-            elif task_type == 'decoction':
-                task.decoction_worker_id = worker_id
-                task.decoction_worker_name = worker.name
-
-            db.session.commit()
+            try:
+                TaskService.assign_worker(task_id, worker_id, task_type,
+                                          parse_version(request.form.get('version_id')))
+            except TaskConflictError as e:
+                return jsonify({'success': False, 'conflict': True, 'message': str(e)}), 409
+            except WipLimitError as e:
+                return jsonify({'success': False, 'wip_limit': True, 'message': str(e)})
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)})
+
+            worker = WorkerModel.query.get(worker_id)
             return jsonify({'success': True, 'message': f'任务 {task_id} 成功分配给工人 {worker.name}!'})
 
         elif operation == 'rollback':
@@ -224,47 +270,154 @@ def assign_tasks():
             if not admin_user or admin_user.password != rollback_password:
                 return jsonify({'success': False, 'message': '操作密码错误! 无法执行回退操作。'})
 
-            task = TaskModel.query.get_or_404(task_id)
             rollback_phase = request.form.get('rollback_phase')
+            try:
+                TaskService.rollback_task(task_id, rollback_phase,
+                                          parse_version(request.form.get('version_id')))
+            except TaskConflictError as e:
+                return jsonify({'success': False, 'conflict': True, 'message': str(e)}), 409
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)})
 
-            if rollback_phase == 'receive' and task.receive_time:
-                task.receive_time = None
-                task.receive_worker_id = None
-                task.receive_worker_name = None
-                task.status = '未完成'
-                db.session.commit()
-                return jsonify({'success': True, 'message': f"任务 {task_id} 已成功回退到收方前!"})
-
-            elif rollback_phase == 'formulate' and task.form_time:
-                task.form_time = None
-                task.form_worker_id = None
-                task.form_worker_name = None
-                db.session.commit()
-                return jsonify({'success': True, 'message': f"任务 {task_id} 已成功回退到配方前!"})
-
-            else:
-                return jsonify({'success': False, 'message': '无法回退到该阶段。'})
+            return jsonify({'success': True, 'message': f"任务 {task_id} 已成功回退到{ROLLBACK_TARGETS[rollback_phase]}!"})
 
     unfinished_tasks = TaskModel.query.filter(TaskModel.status != '完成').count()
     finished_tasks = TaskModel.query.filter(TaskModel.status == '完成').count()
 
     stats = {'unfinished_orders': unfinished_tasks, 'finished_orders': finished_tasks}
 
-    tasks = TaskModel.query.order_by(TaskModel.status.desc(), TaskModel.task_id.asc()).all()
-    for task in tasks:
-        if task.decoction_end_time:
-            task.phase_status = "煎药已完成"
-        elif task.decoction_start_time:
-            task.phase_status = "煎药进行中"
-        elif task.form_time:
-            task.phase_status = "配方已完成，煎药未完成"
-        elif task.receive_time:
-            task.phase_status = "收方已完成，配方未完成"
-        else:
-            task.phase_status = "收方未完成"
+    # 任务列表由 assign_tasks.js 通过 /admin/tasks/board 分页加载
+    workers = [{'worker_id': w.worker_id, 'name': w.name} for w in WorkerModel.query.all()]
+    return render_template('assign_tasks.html', workers=workers, stats=stats,
+                           stage_filters=STAGE_FILTERS)
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+@admin_bp.route('/tasks/board')
+def task_board_api():
+    """任务看板分页数据（API）
+
+    查询参数：stage（阶段筛选）、worker_id、sort（stage/-stage/task_id/-task_id）、cursor、limit
+    """
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({'success': False, 'message': '无权限'}), 403
+
+    try:
+        page = TaskService.get_task_board(
+            stage=request.args.get('stage') or None,
+            worker_id=request.args.get('worker_id', type=int),
+            sort=request.args.get('sort') or 'stage',
+            cursor=request.args.get('cursor') or None,
+            limit=min(request.args.get('limit', type=int) or 0, TASK_BOARD_MAX_LIMIT) or None
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    tasks_data = [{
+        'task_id': t.task_id,
+        'prescription_id': t.prescription_id,
+        'stage': t.stage,
+        'version_id': t.version_id,
+        'phase_status': TaskService.get_phase_status(t),
+        'status': t.status,
+        'receive_worker_id': t.receive_worker_id,
+        'receive_worker_name': t.receive_worker_name,
+        'form_worker_id': t.form_worker_id,
+        'form_worker_name': t.form_worker_name,
+        'decoction_worker_id': t.decoction_worker_id,
+        'decoction_worker_name': t.decoction_worker_name,
+        'receive_time': _isoformat(t.receive_time),
+        'form_time': _isoformat(t.form_time),
+        'decoction_start_time': _isoformat(t.decoction_start_time),
+        'decoction_end_time': _isoformat(t.decoction_end_time)
+    } for t in page['items']]
+
+    return jsonify({'success': True, 'tasks': tasks_data, 'next_cursor': page['next_cursor']})
+
+@admin_bp.route('/tasks/auto_assign', methods=['GET', 'POST'])
+def auto_assign_tasks():
+    """为未分配工人的积压任务自动分配负载最低的工人（API）
+
+    GET 只返回分配计划（试运行），POST 按计划执行分配；limit 为每个工序最多处理的任务数
+    """
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({'success': False, 'message': '无权限'}), 403
+
+    dry_run = request.method == 'GET'
+    limit = min(request.values.get('limit', type=int) or AUTO_ASSIGN_MAX_LIMIT, AUTO_ASSIGN_MAX_LIMIT)
+    assignments = AssignmentService.assign_backlog(dry_run=dry_run, limit=limit)
+    return jsonify({'success': True, 'dry_run': dry_run, 'assignments': assignments})
+
+@admin_bp.route('/decoction')
+def decoction_schedule():
+    """煎药锅与煎药排程页面"""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('无权限访问!', 'danger')
+        return redirect(url_for('auth.dashboard'))
+
+    schedule = DecoctionService.get_schedule(limit=DECOCTION_SCHEDULE_LIMIT)
+    return render_template('decoction_schedule.html', schedule=schedule, pots=schedule['pots'])
+
+@admin_bp.route('/decoction/pots', methods=['POST'])
+def create_decoction_pot():
+    """新增煎药锅"""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('无权限访问!', 'danger')
+        return redirect(url_for('auth.dashboard'))
+
+    try:
+        pot = DecoctionService.create_pot(
+            request.form.get('name', '').strip(),
+            request.form.get('slots', type=int) or 0,
+            request.form.get('cycle_minutes', type=int) or 0
+        )
+    except ValueError as e:
+        flash(str(e), 'danger')
+    else:
+        flash(f'煎药锅 {pot.name} 已添加!', 'success')
+    return redirect(url_for('admin.decoction_schedule'))
+
+@admin_bp.route('/decoction/pots/<int:pot_id>/toggle', methods=['POST'])
+def toggle_decoction_pot(pot_id):
+    """启用或停用煎药锅"""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('无权限访问!', 'danger')
+        return redirect(url_for('auth.dashboard'))
+
+    pot = DecoctionService.set_pot_active(pot_id, request.form.get('is_active') == '1')
+    flash(f"煎药锅 {pot.name} 已{'启用' if pot.is_active else '停用'}!", 'success')
+    return redirect(url_for('admin.decoction_schedule'))
+
+@admin_bp.route('/decoction/schedule')
+def decoction_schedule_api():
+    """煎药排程数据（API）：各煎药锅占用情况、正在煎煮与待煎药任务的预计开始与完成时间"""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({'success': False, 'message': '无权限'}), 403
 
-    workers = WorkerModel.query.all()
-    return render_template('assign_tasks.html', tasks=tasks, workers=workers, stats=stats)
+    limit = min(request.args.get('limit', type=int) or DECOCTION_SCHEDULE_LIMIT, DECOCTION_SCHEDULE_LIMIT)
+    schedule = DecoctionService.get_schedule(limit=limit)
+    pots_data = [{
+        'pot_id': pot.pot_id,
+        'name': pot.name,
+        'slots': pot.slots,
+        'in_use': in_use,
+        'cycle_minutes': pot.cycle_minutes,
+        'is_active': pot.is_active,
+    } for pot, in_use in schedule['pots']]
+
+    def entries(key):
+        return [{
+            'task_id': e['task'].task_id,
+            'prescription_id': e['task'].prescription_id,
+            'pot_id': e['pot'].pot_id,
+            'pot_name': e['pot'].name,
+            'start': _isoformat(e['start']),
+            'end': _isoformat(e['end']),
+        } for e in schedule[key]]
+
+    return jsonify({'success': True, 'pots': pots_data,
+                    'decocting': entries('decocting'), 'queue': entries('queue')})
 
 @admin_bp.route('/alerts')
 def alerts():
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from models import PatientModel, PrescriptionModel, TaskModel
-from exts import db
+from models import PatientModel, PrescriptionModel
+from services.prescription_service import PrescriptionService
+from services.task_service import STAGE_FILTERS
 
 doctor_bp = Blueprint('doctor', __name__, url_prefix='/doctor')
 
@@ -17,36 +18,13 @@ def create_prescription():
         amount = request.form.get('amount')
         usage_instructions = request.form.get('usage_instructions')
 
-        new_prescription = PrescriptionModel(
+        PrescriptionService.create_prescription(
             patient_id=patient_id,
             doctor_id=doctor_id,
             amount=amount,
             usage_instructions=usage_instructions,
             status='待配方'
         )
-        db.session.add(new_prescription)
-        db.session.commit()
-
-        prescription_id = new_prescription.prescription_id
-
-        new_task = TaskModel(
-            prescription_id=prescription_id,
-            receive_worker_id=None,
-            receive_worker_name=None,
-            form_worker_id=None,
-            form_worker_name=None,
-            decoction_worker_id=None,
-            decoction_worker_name=None,
-            admin_id=None,
-            admin_name=None,
-            receive_time=None,
-            form_time=None,
-            decoction_start_time=None,
-            decoction_end_time=None,
-            status='未完成'
-        )
-        db.session.add(new_task)
-        db.session.commit()
 
         flash('处方创建成功，并已生成任务!', 'success')
         return redirect(url_for('doctor.prescriptions'))
@@ -62,27 +40,16 @@ def prescriptions():
 
     doctor_id = session.get('role_id')
     if doctor_id:
-        prescriptions = PrescriptionModel.query.filter_by(doctor_id=doctor_id).all()
-        prescriptions_with_status = []
-        for prescription in prescriptions:
-            task = TaskModel.query.filter_by(prescription_id=prescription.prescription_id).first()
-            if not task:
-                status = "未分配任务"
-            elif not task.receive_time:
-                status = "待收方"
-            elif not task.form_time:
-                status = "待配方"
-            elif not task.decoction_start_time:
-                status = "待煎药"
-            elif not task.decoction_end_time:
-                status = "煎药中"
-            else:
-                status = "已完成"
-            prescriptions_with_status.append({
-                "prescription": prescription,
-                "status": status
-            })
-        return render_template('doctor_prescriptions.html', prescriptions=prescriptions_with_status)
+        status = request.args.get('status') or None
+        cursor = request.args.get('cursor') or None
+        try:
+            page = PrescriptionService.get_prescriptions_by_doctor(doctor_id, status=status, cursor=cursor)
+        except ValueError as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('doctor.prescriptions'))
+        return render_template('doctor_prescriptions.html', prescriptions=page['items'],
+                               next_cursor=page['next_cursor'], status=status,
+                               status_filters=STAGE_FILTERS)
     flash('未找到医生信息!', 'danger')
     return redirect(url_for('auth.dashboard'))
 
@@ -95,7 +62,7 @@ def prescription_detail(prescription_id):
     doctor_id = session.get('role_id')
     prescription = PrescriptionModel.query.filter_by(prescription_id=prescription_id, doctor_id=doctor_id).first()
     if prescription:
-        task = TaskModel.query.filter_by(prescription_id=prescription_id).first()
+        task = prescription.task
         return render_template('doctor_prescription_detail.html', prescription=prescription, task=task)
     flash('未找到该处方或无权限查看!', 'danger')
     return redirect(url_for('doctor.prescriptions'))
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from models import PrescriptionModel, TaskModel
-from exts import db
+from models import PrescriptionModel
+from services.prescription_service import PrescriptionService
+from services.task_service import STAGE_FILTERS
 
 patient_bp = Blueprint('patient', __name__, url_prefix='/patient')
 
@@ -12,27 +13,16 @@ def prescriptions():
 
     patient_id = session.get('role_id')
     if patient_id:
-        prescriptions = PrescriptionModel.query.filter_by(patient_id=patient_id).all()
-        prescriptions_with_status = []
-        for prescription in prescriptions:
-            task = TaskModel.query.filter_by(prescription_id=prescription.prescription_id).first()
-            if not task:
-                status = "未分配任务"
-            elif not task.receive_time:
-                status = "待收方"
-            elif not task.form_time:
-                status = "待配方"
-            elif not task.decoction_start_time:
-                status = "待煎药"
-            elif not task.decoction_end_time:
-                status = "煎药中"
-            else:
-                status = "已完成"
-            prescriptions_with_status.append({
-                "prescription": prescription,
-                "status": status
-            })
-        return render_template('patient_prescriptions.html', prescriptions=prescriptions_with_status)
+        status = request.args.get('status') or None
+        cursor = request.args.get('cursor') or None
+        try:
+            page = PrescriptionService.get_prescriptions_by_patient(patient_id, status=status, cursor=cursor)
+        except ValueError as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('patient.prescriptions'))
+        return render_template('patient_prescriptions.html', prescriptions=page['items'],
+                               next_cursor=page['next_cursor'], status=status,
+                               status_filters=STAGE_FILTERS)
     flash('未找到患者信息!', 'danger')
     return redirect(url_for('auth.dashboard'))
 
@@ -45,7 +35,7 @@ def prescription_detail(prescription_id):
     patient_id = session.get('role_id')
     prescription = PrescriptionModel.query.filter_by(prescription_id=prescription_id, patient_id=patient_id).first()
     if prescription:
-        task = TaskModel.query.filter_by(prescription_id=prescription_id).first()
+        task = prescription.task
         return render_template('patient_prescription_detail.html', prescription=prescription, task=task)
     flash('未找到该处方或无权限查看!', 'danger')
     return redirect(url_for('patient.prescriptions'))
@@ -1,23 +1,56 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from datetime import datetime
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from models import TaskModel
-from exts import db
+from services.task_service import TaskService, TaskConflictError, ACTION_LABELS, parse_version
 
 worker_bp = Blueprint('worker', __name__, url_prefix='/worker')
 
+# 批量更新单次最多条目数
+BATCH_UPDATE_MAX_ITEMS = 200
+
 @worker_bp.route('/tasks', methods=['GET'])
 def tasks():
+    """待办队列：只显示当前阶段由本人负责的任务"""
+    if 'user_id' not in session or session.get('role') != 'worker':
+        flash('无权限访问!', 'danger')
+        return redirect(url_for('auth.dashboard'))
+
+    worker_id = int(session.get('role_id'))
+    queue = TaskService.get_worker_queue(worker_id)
+    return render_template('worker_tasks.html', queue=queue, action_labels=ACTION_LABELS)
+
+@worker_bp.route('/queue', methods=['GET'])
+def queue_api():
+    """待办队列（API），供工作台定时刷新"""
+    if 'user_id' not in session or session.get('role') != 'worker':
+        return jsonify({'success': False, 'message': '无权限'}), 403
+
+    worker_id = int(session.get('role_id'))
+    queue_data = [{
+        'task_id': task.task_id,
+        'prescription_id': task.prescription_id,
+        'stage': task.stage,
+        'action': action,
+        'action_label': ACTION_LABELS[action],
+        'expected_pickup_time': task.prescription.expected_pickup_time.isoformat()
+        if task.prescription.expected_pickup_time else None
+    } for task, action in TaskService.get_worker_queue(worker_id)]
+
+    return jsonify({'success': True, 'tasks': queue_data, 'count': len(queue_data)})
+
+@worker_bp.route('/tasks/history', methods=['GET'])
+def task_history():
+    """已完成任务历史（分页）"""
     if 'user_id' not in session or session.get('role') != 'worker':
         flash('无权限访问!', 'danger')
         return redirect(url_for('auth.dashboard'))
 
     worker_id = int(session.get('role_id'))
-    tasks = TaskModel.query.filter(
-        (TaskModel.receive_worker_id == worker_id) |
-        (TaskModel.form_worker_id == worker_id) |
-        (TaskModel.decoction_worker_id == worker_id)
-    ).all()
-    return render_template('worker_tasks.html', tasks=tasks)
+    try:
+        page = TaskService.get_worker_history(worker_id, cursor=request.args.get('cursor') or None)
+    except ValueError as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('worker.task_history'))
+    return render_template('worker_task_history.html', tasks=page['items'], next_cursor=page['next_cursor'])
 
 @worker_bp.route('/tasks/update/<int:task_id>', methods=['GET', 'POST'])
 def update_task_status(task_id):
@@ -26,6 +59,33 @@ def update_task_status(task_id):
         return redirect(url_for('auth.dashboard'))
 
     worker_id = int(session.get('role_id'))
+
+    # 提交操作时由服务层以条件UPDATE一并校验任务状态与负责工人，无需预先读取任务
+    # 表单提交返回页面；JSON 请求（如扫码终端）返回 JSON，任务已被他人修改时为 409
+    if request.method == 'POST':
+        wants_json = request.is_json
+        data = (request.get_json(silent=True) or {}) if wants_json else request.form
+
+        try:
+            version_id = TaskService.update_task_status(
+                task_id, worker_id, data.get('action'), parse_version(data.get('version_id'))
+            )
+        except TaskConflictError as e:
+            if wants_json:
+                return jsonify({'success': False, 'conflict': True, 'message': str(e)}), 409
+            flash(str(e), 'warning')
+            return redirect(url_for('worker.update_task_status', task_id=task_id))
+        except ValueError as e:
+            if wants_json:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            flash(str(e), 'warning')
+            return redirect(url_for('worker.update_task_status', task_id=task_id))
+
+        if wants_json:
+            return jsonify({'success': True, 'message': '任务状态更新成功!', 'version_id': version_id})
+        flash('任务状态更新成功!', 'success')
+        return redirect(url_for('worker.tasks'))
+
     task = TaskModel.query.get_or_404(task_id)
 
     if task.status == '完成':
@@ -36,24 +96,40 @@ def update_task_status(task_id):
         flash('无权限操作此任务!', 'danger')
         return redirect(url_for('worker.tasks'))
 
-    if request.method == 'POST':
-        action = request.form.get('action')
-
-        if action == 'receive' and task.receive_worker_id == worker_id and not task.receive_time:
-            task.receive_time = datetime.utcnow()
-        elif action == 'formulate' and task.form_worker_id == worker_id and task.receive_time and not task.form_time:
-            task.form_time = datetime.utcnow()
-        elif action == 'decoction_start' and task.decoction_worker_id == worker_id and task.form_time and not task.decoction_start_time:
-            task.decoction_start_time = datetime.utcnow()
-        elif action == 'decoction_end' and task.decoction_worker_id == worker_id and task.decoction_start_time and not task.decoction_end_time:
-            task.decoction_end_time = datetime.utcnow()
-            task.status = '完成'
-        else:
-            flash('当前任务未满足操作条件，无法完成此操作。', 'warning')
-            return redirect(url_for('worker.update_task_status', task_id=task_id))
+    return render_template('update_task.html', task=task)
 
-        db.session.commit()
-        flash('任务状态更新成功!', 'success')
-        return redirect(url_for('worker.tasks'))
+@worker_bp.route('/tasks/batch_update', methods=['POST'])
+def batch_update_task_status():
+    """批量更新任务状态（API）
 
-    return render_template('update_task.html', task=task)
+    请求体：{"items": [{"task_id": 1, "action": "decoction_start", "version_id": 3}, ...]}
+    version_id 可选，提交时任务已被他人修改的条目 conflict 为 true。
+    返回与 items 顺序一致的逐条结果，成功的条目在同一事务中提交。
+    """
+    if 'user_id' not in session or session.get('role') != 'worker':
+        return jsonify({'success': False, 'message': '无权限'}), 403
+
+    data = request.get_json(silent=True) or {}
+    raw_items = data.get('items')
+    if not isinstance(raw_items, list) or not raw_items:
+        return jsonify({'success': False, 'message': '请求中缺少 items 列表'}), 400
+    if len(raw_items) > BATCH_UPDATE_MAX_ITEMS:
+        return jsonify({'success': False, 'message': f'单次最多提交 {BATCH_UPDATE_MAX_ITEMS} 条'}), 400
+
+    try:
+        items = [
+            (int(item['task_id']), str(item['action']), parse_version(item.get('version_id')))
+            for item in raw_items
+        ]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({'success': False, 'message': '每个条目需要包含 task_id 和 action'}), 400
+
+    worker_id = int(session.get('role_id'))
+    results = TaskService.batch_update_task_status(worker_id, items)
+    succeeded = sum(1 for result in results if result['success'])
+    return jsonify({
+        'success': succeeded == len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    })
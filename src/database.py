@@ -0,0 +1,84 @@
+"""数据库引擎初始化、连接调优与跨方言SQL表达式"""
+from sqlalchemy import event, func, String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from exts import db
+
+
+class hour_bucket(FunctionElement):
+    """时间截断到小时的分桶键，各数据库均返回 'YYYY-MM-DD HH:00' 格式的文本"""
+    type = String()
+    name = 'hour_bucket'
+    inherit_cache = True
+
+
+class day_bucket(FunctionElement):
+    """时间截断到天的分桶键，各数据库均返回 'YYYY-MM-DD' 格式的文本"""
+    type = String()
+    name = 'day_bucket'
+    inherit_cache = True
+
+
+@compiles(hour_bucket)
+def _compile_hour_bucket(element, compiler, **kw):
+    return compiler.process(func.strftime('%Y-%m-%d %H:00', *element.clauses), **kw)
+
+
+@compiles(day_bucket)
+def _compile_day_bucket(element, compiler, **kw):
+    return compiler.process(func.strftime('%Y-%m-%d', *element.clauses), **kw)
+
+
+# PostgreSQL 的格式串直接写入SQL，避免SELECT与GROUP BY中的绑定参数被视为不同表达式
+@compiles(hour_bucket, 'postgresql')
+def _compile_hour_bucket_pg(element, compiler, **kw):
+    return "to_char(%s, 'YYYY-MM-DD HH24:00')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_bucket, 'postgresql')
+def _compile_day_bucket_pg(element, compiler, **kw):
+    return "to_char(%s, 'YYYY-MM-DD')" % compiler.process(element.clauses, **kw)
+
+
+# 写入数据库文件头的PRAGMA，只读连接（mode=ro）执行会报 "attempt to write a readonly database"，
+# 由主库连接设置后对只读连接同样生效
+PERSISTENT_PRAGMAS = {'journal_mode'}
+
+
+def _apply_sqlite_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def _is_read_only(engine):
+    return engine.url.query.get('mode') == 'ro'
+
+
+def setup_database(app):
+    """初始化数据库扩展，并为每个新的SQLite连接执行配置中的 SQLITE_PRAGMAS
+
+    只读副本（mode=ro）的连接跳过 PERSISTENT_PRAGMAS，只执行连接级设置。
+    """
+    db.init_app(app)
+
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    if not pragmas:
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name != 'sqlite':
+                continue
+            if _is_read_only(engine):
+                engine_pragmas = {
+                    name: value for name, value in pragmas.items() if name not in PERSISTENT_PRAGMAS
+                }
+            else:
+                engine_pragmas = pragmas
+            event.listen(engine, 'connect', _apply_sqlite_pragmas(engine_pragmas))
@@ -1,2 +1,51 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 from flask_sqlalchemy import SQLAlchemy
-db=SQLAlchemy()
\ No newline at end of file
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, UpdateBase, event
+
+# 只读副本在 SQLALCHEMY_BINDS 中的键名（未配置时所有查询都走主库）
+REPLICA_BIND = 'replica'
+
+_read_only = ContextVar('read_only', default=False)
+
+
+@contextmanager
+def read_only():
+    """标记其中的查询可以路由到只读副本，也可作为装饰器使用
+
+    副本可能有复制延迟，只用于看板、报表等允许读到稍旧数据的场景。
+    """
+    token = _read_only.set(True)
+    try:
+        yield
+    finally:
+        _read_only.reset(token)
+
+
+class RoutingSession(Session):
+    """读写分离会话：只读标记下的普通SELECT走副本，其余语句走主库
+
+    会话一旦产生写入（flush或直接执行DML），之后的查询都留在主库，
+    保证同一请求内读到自己的写入。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if isinstance(clause, UpdateBase):
+                self.info['wrote'] = True
+            elif (_read_only.get()
+                    and not self.info.get('wrote')
+                    and REPLICA_BIND in self._db.engines
+                    and isinstance(clause, Select)
+                    and clause._for_update_arg is None):
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _mark_session_wrote(session, flush_context, instances):
+    session.info['wrote'] = True
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
@@ -17,6 +17,8 @@ from models import (
     AdminModel, PrescriptionModel, TaskModel
 )
 from exts import db
+from database import setup_database
+from migrations import run_migrations
 import config
 
 def create_app():
@@ -30,12 +32,15 @@ def init_database():
     print("正在初始化SQLite数据库...")
     
     app = create_app()
-    db.init_app(app)
+    setup_database(app)
     
     with app.app_context():
         # 创建所有表
         db.create_all()
         print("数据库表创建完成！")
+
+        # 补记/执行结构迁移
+        run_migrations()
         
         # 检查是否已有数据
         if UserModel.query.first():
@@ -50,7 +55,7 @@ def create_sample_data():
     print("正在创建示例数据...")
     
     app = create_app()
-    db.init_app(app)
+    setup_database(app)
     
     with app.app_context():
         try:
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本
+按版本号顺序对已有数据库执行结构变更，已执行的版本记录在 schema_migrations 表中
+使用方法：python migrations.py
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+from sqlalchemy import inspect
+from exts import db
+from models import PrescriptionModel, TaskModel, TaskStage, TaskEventModel, DecoctionPotModel, WorkerModel
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('description', db.String(200)),
+    db.Column('applied_at', db.DateTime),
+)
+
+
+def _create_index(conn, name, table, *columns):
+    conn.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})')
+
+
+def _drop_index(conn, name):
+    conn.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+
+
+def _add_column(conn, model, column_name):
+    """按模型定义为已有表添加列（已存在则跳过）"""
+    table = model.__tablename__
+    if column_name in {c['name'] for c in inspect(conn).get_columns(table)}:
+        return
+    column = model.__table__.c[column_name]
+    ddl = f'ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}'
+    if column.server_default is not None:
+        ddl += f' DEFAULT {column.server_default.arg}'
+    if not column.nullable:
+        ddl += ' NOT NULL'
+    conn.exec_driver_sql(ddl)
+
+
+def _add_hot_path_indexes(conn):
+    _create_index(conn, 'ix_tasks_status_decoction_end', 'tasks', 'status', 'decoction_end_time')
+    _create_index(conn, 'ix_tasks_prescription_id', 'tasks', 'prescription_id')
+    _create_index(conn, 'ix_tasks_receive_worker_status', 'tasks', 'receive_worker_id', 'status')
+    _create_index(conn, 'ix_tasks_form_worker_status', 'tasks', 'form_worker_id', 'status')
+    _create_index(conn, 'ix_tasks_decoction_worker_status', 'tasks', 'decoction_worker_id', 'status')
+    _create_index(conn, 'ix_prescriptions_doctor_date', 'prescriptions', 'doctor_id', 'date')
+    _create_index(conn, 'ix_prescriptions_patient_date', 'prescriptions', 'patient_id', 'date')
+    _create_index(conn, 'ix_prescriptions_date', 'prescriptions', 'date')
+    _create_index(conn, 'ix_alerts_task_type_read', 'alerts', 'task_id', 'type', 'is_read')
+    _create_index(conn, 'ix_alerts_type_read_created', 'alerts', 'type', 'is_read', 'created_at')
+    _create_index(conn, 'ix_alerts_read_created', 'alerts', 'is_read', 'created_at')
+    _create_index(conn, 'ix_alerts_created_at', 'alerts', 'created_at')
+
+
+def _add_task_stage(conn):
+    """新增 tasks.stage 并根据时间戳回填"""
+    _add_column(conn, TaskModel, 'stage')
+    conn.execute(db.update(TaskModel.__table__).values(stage=db.case(
+        (TaskModel.receive_time.is_(None), TaskStage.RECEIVE),
+        (TaskModel.form_time.is_(None), TaskStage.FORMULATE),
+        (TaskModel.decoction_start_time.is_(None), TaskStage.DECOCTION),
+        (TaskModel.decoction_end_time.is_(None), TaskStage.DECOCTING),
+        else_=TaskStage.COMPLETED
+    )))
+    _drop_index(conn, 'ix_tasks_receive_worker_status')
+    _drop_index(conn, 'ix_tasks_form_worker_status')
+    _drop_index(conn, 'ix_tasks_decoction_worker_status')
+    _create_index(conn, 'ix_tasks_stage', 'tasks', 'stage')
+    _create_index(conn, 'ix_tasks_receive_worker_stage', 'tasks', 'receive_worker_id', 'stage')
+    _create_index(conn, 'ix_tasks_form_worker_stage', 'tasks', 'form_worker_id', 'stage')
+    _create_index(conn, 'ix_tasks_decoction_worker_stage', 'tasks', 'decoction_worker_id', 'stage')
+
+
+def _add_task_events(conn):
+    """新增 task_events 表，并根据已有任务的时间戳补记流转事件"""
+    TaskEventModel.__table__.create(conn, checkfirst=True)
+    if conn.execute(db.select(TaskEventModel.event_id).limit(1)).first():
+        return
+
+    events = TaskEventModel.__table__
+    # (动作, 完成后阶段, 时间列, 工人列)，按时间顺序依次补记
+    transitions = [
+        ('receive', TaskStage.FORMULATE, TaskModel.receive_time, TaskModel.receive_worker_id),
+        ('formulate', TaskStage.DECOCTION, TaskModel.form_time, TaskModel.form_worker_id),
+        ('decoction_start', TaskStage.DECOCTING, TaskModel.decoction_start_time, TaskModel.decoction_worker_id),
+        ('decoction_end', TaskStage.COMPLETED, TaskModel.decoction_end_time, TaskModel.decoction_worker_id),
+    ]
+    for action, stage, time_column, worker_column in transitions:
+        conn.execute(events.insert().from_select(
+            ['task_id', 'action', 'stage', 'worker_id', 'created_at'],
+            db.select(
+                TaskModel.task_id, db.literal(action), db.literal(stage), worker_column, time_column
+            ).where(time_column.isnot(None)).order_by(time_column)
+        ))
+
+
+def _add_prescription_keyset_indexes(conn):
+    """处方列表游标分页：医生/患者索引追加 prescription_id 作为排序的第二键"""
+    for column in ('doctor_id', 'patient_id'):
+        name = f"ix_prescriptions_{column.split('_')[0]}_date"
+        _drop_index(conn, name)
+        _create_index(conn, name, 'prescriptions', column, 'date', 'prescription_id')
+
+
+def _add_task_board_index(conn):
+    """任务看板按 (stage, task_id) 排序与游标分页"""
+    _drop_index(conn, 'ix_tasks_stage')
+    _create_index(conn, 'ix_tasks_stage', 'tasks', 'stage', 'task_id')
+
+
+def _add_worker_queue_indexes(conn):
+    """工人待办队列与历史分页：工人/阶段索引追加 task_id"""
+    for column in ('receive_worker_id', 'form_worker_id', 'decoction_worker_id'):
+        name = f"ix_tasks_{column[:-3]}_stage"
+        _drop_index(conn, name)
+        _create_index(conn, name, 'tasks', column, 'stage', 'task_id')
+
+
+def _add_task_version(conn):
+    """新增 tasks.version_id 乐观锁版本号（已有任务从1开始）"""
+    _add_column(conn, TaskModel, 'version_id')
+
+
+def _add_task_event_action_index(conn):
+    """按操作类型统计近期完成数（自动分配的工人负载）"""
+    _create_index(conn, 'ix_task_events_action_created', 'task_events', 'action', 'created_at', 'worker_id')
+
+
+def _add_task_priority(conn):
+    """新增 tasks.priority_score 并按处方取药时间与当前阶段回填"""
+    from services.task_service import TaskService
+    _add_column(conn, TaskModel, 'priority_score')
+    rows = conn.execute(db.select(
+        TaskModel.task_id, TaskModel.stage, PrescriptionModel.expected_pickup_time, PrescriptionModel.date
+    ).join(PrescriptionModel, TaskModel.prescription_id == PrescriptionModel.prescription_id)).all()
+    if rows:
+        conn.execute(
+            db.update(TaskModel.__table__)
+            .where(TaskModel.task_id == db.bindparam('b_task_id'))
+            .values(priority_score=db.bindparam('b_score')),
+            [{'b_task_id': row.task_id, 'b_score': TaskService.priority_score(row, row.stage)} for row in rows]
+        )
+    _create_index(conn, 'ix_tasks_stage_priority', 'tasks', 'stage', 'priority_score', 'task_id')
+
+
+def _add_task_predicted_pickup(conn):
+    """新增 tasks.predicted_pickup_time（已有任务在下次进入新阶段时填入）"""
+    _add_column(conn, TaskModel, 'predicted_pickup_time')
+
+
+def _add_decoction_pots(conn):
+    """新增 decoction_pots 表与 tasks.pot_id"""
+    DecoctionPotModel.__table__.create(conn, checkfirst=True)
+    _add_column(conn, TaskModel, 'pot_id')
+    _create_index(conn, 'ix_tasks_pot_stage', 'tasks', 'pot_id', 'stage')
+
+
+def _worker_columns(conn):
+    return {c['name'] for c in inspect(conn).get_columns('workers')}
+
+
+def _add_worker_wip_limit(conn):
+    """新增 workers.wip_limit（为空时使用配置的默认上限；迁移 14 拆分为各工序的上限）"""
+    if 'wip_limit' not in _worker_columns(conn):
+        conn.exec_driver_sql('ALTER TABLE workers ADD COLUMN wip_limit INTEGER')
+
+
+def _split_worker_wip_limit(conn):
+    """workers.wip_limit 拆分为各工序的上限 wip_limit_<工序>，已设置的上限复制到三个工序"""
+    phases = ('receive', 'formulate', 'decoction')
+    for phase in phases:
+        _add_column(conn, WorkerModel, f'wip_limit_{phase}')
+    if 'wip_limit' in _worker_columns(conn):
+        assignments = ', '.join(f'wip_limit_{phase} = wip_limit' for phase in phases)
+        conn.exec_driver_sql(f'UPDATE workers SET {assignments} WHERE wip_limit IS NOT NULL')
+        conn.exec_driver_sql('ALTER TABLE workers DROP COLUMN wip_limit')
+
+
+def _backfill_prescription_date(conn):
+    """回填为空的 prescriptions.date（游标分页的排序键），PostgreSQL 上同时加非空约束
+
+    依次取任务的创建事件时间、收方时间，都没有时取迁移时间。
+    SQLite 不支持修改已有列的约束，由模型的 nullable=False 与默认值保证新处方非空。
+    """
+    created = db.select(db.func.min(TaskEventModel.created_at)).join(
+        TaskModel, TaskModel.task_id == TaskEventModel.task_id
+    ).where(
+        TaskModel.prescription_id == PrescriptionModel.prescription_id,
+        TaskEventModel.action == 'create'
+    ).scalar_subquery()
+    received = db.select(db.func.min(TaskModel.receive_time)).where(
+        TaskModel.prescription_id == PrescriptionModel.prescription_id
+    ).scalar_subquery()
+    conn.execute(
+        db.update(PrescriptionModel.__table__)
+        .where(PrescriptionModel.date.is_(None))
+        .values(date=db.func.coalesce(created, received, datetime.utcnow()))
+    )
+    if conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql('ALTER TABLE prescriptions ALTER COLUMN date SET NOT NULL')
+
+
+# 迁移列表：(版本号, 描述, 升级函数)，只能追加，不能修改已发布的版本
+MIGRATIONS = [
+    (1, '任务/处方/告警热点查询索引', _add_hot_path_indexes),
+    (2, '任务显式阶段列 tasks.stage', _add_task_stage),
+    (3, '任务流转事件表 task_events', _add_task_events),
+    (4, '处方游标分页索引', _add_prescription_keyset_indexes),
+    (5, '任务看板排序索引', _add_task_board_index),
+    (6, '工人待办队列索引', _add_worker_queue_indexes),
+    (7, '任务乐观锁版本号 tasks.version_id', _add_task_version),
+    (8, '任务事件按操作统计索引', _add_task_event_action_index),
+    (9, '任务优先级 tasks.priority_score', _add_task_priority),
+    (10, '任务预测完成时间 tasks.predicted_pickup_time', _add_task_predicted_pickup),
+    (11, '煎药锅 decoction_pots 与 tasks.pot_id', _add_decoction_pots),
+    (12, '工人在制任务上限 workers.wip_limit', _add_worker_wip_limit),
+    (13, '处方日期 prescriptions.date 非空', _backfill_prescription_date),
+    (14, '工人各工序在制任务上限 workers.wip_limit_<工序>', _split_worker_wip_limit),
+]
+
+
+def run_migrations(engine=None):
+    """执行所有未执行的迁移（需要应用上下文），返回本次执行的版本号列表
+
+    每个迁移在独立事务中执行，迁移函数应当可以重复执行，
+    以便由 db.create_all() 新建的数据库也能安全地补记版本。
+    """
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        applied = set(conn.execute(db.select(schema_migrations.c.version)).scalars())
+
+    executed = []
+    for version, description, upgrade in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow()
+            ))
+        executed.append(version)
+        print(f"已执行迁移 {version}: {description}")
+    return executed
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    from database import setup_database
+    import config
+
+    print("=== 数据库迁移工具 ===")
+    app = Flask(__name__)
+    app.config.from_object(config)
+    setup_database(app)
+
+    try:
+        with app.app_context():
+            db.create_all()
+            executed = run_migrations()
+        if executed:
+            print(f"\n迁移完成，共执行 {len(executed)} 个版本。")
+        else:
+            print("数据库已是最新版本。")
+    except Exception as e:
+        print(f"迁移失败: {e}")
+        sys.exit(1)
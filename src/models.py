@@ -34,6 +34,10 @@ class WorkerModel(db.Model):
     name = db.Column(db.String(50))
     age = db.Column(db.Integer)
     contact_number = db.Column(db.String(15))
+    # 在收方、配方、煎药工序同时进行中的任务数上限，为空时使用配置 WIP_LIMITS 中该工序的默认值
+    wip_limit_receive = db.Column(db.Integer)
+    wip_limit_formulate = db.Column(db.Integer)
+    wip_limit_decoction = db.Column(db.Integer)
 
 class AdminModel(db.Model):
     __tablename__ = 'admins'
@@ -43,17 +47,69 @@ class AdminModel(db.Model):
 
 class PrescriptionModel(db.Model):
     __tablename__ = 'prescriptions'
+    __table_args__ = (
+        db.Index('ix_prescriptions_doctor_date', 'doctor_id', 'date', 'prescription_id'),
+        db.Index('ix_prescriptions_patient_date', 'patient_id', 'date', 'prescription_id'),
+        db.Index('ix_prescriptions_date', 'date'),
+    )
     prescription_id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.patient_id'))
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.doctor_id'))
-    date = db.Column(db.DateTime, default=datetime.utcnow)
+    # 游标分页的排序键，不能为空
+    date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     amount = db.Column(db.Float)
     usage_instructions = db.Column(db.Text)
     status = db.Column(db.String(20), default='待配方')
     expected_pickup_time = db.Column(db.DateTime)
 
+    # 每张处方对应一个任务
+    task = db.relationship('TaskModel', uselist=False, back_populates='prescription')
+
+class TaskStage:
+    """任务阶段（TaskModel.stage 的取值）"""
+    RECEIVE = 0      # 待收方
+    FORMULATE = 1    # 待配方
+    DECOCTION = 2    # 待煎药
+    DECOCTING = 3    # 煎药中
+    COMPLETED = 4    # 已完成
+
+    LABELS = {
+        RECEIVE: '待收方',
+        FORMULATE: '待配方',
+        DECOCTION: '待煎药',
+        DECOCTING: '煎药中',
+        COMPLETED: '已完成',
+    }
+
+    PHASE_LABELS = {
+        RECEIVE: '收方未完成',
+        FORMULATE: '收方已完成，配方未完成',
+        DECOCTION: '配方已完成，煎药未完成',
+        DECOCTING: '煎药进行中',
+        COMPLETED: '煎药已完成',
+    }
+
+class DecoctionPotModel(db.Model):
+    """煎药锅（设备）：每口锅有若干槽位，可同时煎煮相应数量的处方"""
+    __tablename__ = 'decoction_pots'
+    pot_id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    slots = db.Column(db.Integer, nullable=False, default=1)
+    cycle_minutes = db.Column(db.Integer, nullable=False, default=60)  # 一次煎煮周期
+    is_active = db.Column(db.Boolean, nullable=False, default=True)
+
 class TaskModel(db.Model):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        db.Index('ix_tasks_status_decoction_end', 'status', 'decoction_end_time'),
+        db.Index('ix_tasks_prescription_id', 'prescription_id'),
+        db.Index('ix_tasks_stage', 'stage', 'task_id'),
+        db.Index('ix_tasks_receive_worker_stage', 'receive_worker_id', 'stage', 'task_id'),
+        db.Index('ix_tasks_form_worker_stage', 'form_worker_id', 'stage', 'task_id'),
+        db.Index('ix_tasks_decoction_worker_stage', 'decoction_worker_id', 'stage', 'task_id'),
+        db.Index('ix_tasks_stage_priority', 'stage', 'priority_score', 'task_id'),
+        db.Index('ix_tasks_pot_stage', 'pot_id', 'stage'),
+    )
     task_id = db.Column(db.Integer, primary_key=True)
     prescription_id = db.Column(db.Integer, db.ForeignKey('prescriptions.prescription_id'))
     receive_worker_id = db.Column(db.Integer, db.ForeignKey('workers.worker_id'))
@@ -69,10 +125,49 @@ class TaskModel(db.Model):
     decoction_start_time = db.Column(db.DateTime)
     decoction_end_time = db.Column(db.DateTime)
     status = db.Column(db.String(20), default='未完成')
+    stage = db.Column(db.Integer, nullable=False, default=TaskStage.RECEIVE, server_default='0')
+    # 优先级：取药截止时间减去剩余工序预计耗时，即最晚开始时间（Unix 秒），越小越紧急
+    priority_score = db.Column(db.Float)
+    # 开始煎药时占用的煎药锅（未配置煎药锅时为空）
+    pot_id = db.Column(db.Integer, db.ForeignKey('decoction_pots.pot_id'))
+    # 按历史阶段耗时与当前排队情况预测的完成（可取药）时间，任务每进入一个阶段更新一次
+    predicted_pickup_time = db.Column(db.DateTime)
+    # 乐观锁版本号：每次修改加一，提交时版本不匹配说明期间已被他人修改
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')
+
+    prescription = db.relationship('PrescriptionModel', back_populates='task')
+    pot = db.relationship('DecoctionPotModel')
+
+    __mapper_args__ = {'version_id_col': version_id}
+
+class TaskEventModel(db.Model):
+    """任务流转事件（只追加，不修改不删除）
+
+    与任务变更在同一事务中写入，event_id 单调递增，可作为增量消费的高水位。
+    """
+    __tablename__ = 'task_events'
+    __table_args__ = (
+        db.Index('ix_task_events_task_id', 'task_id', 'event_id'),
+        db.Index('ix_task_events_action_created', 'action', 'created_at', 'worker_id'),
+    )
+    event_id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('tasks.task_id'), nullable=False)
+    # create / assign_<phase> / receive / formulate / decoction_start / decoction_end / rollback_<phase>
+    # / wip_rejected（分配因工人达到在制任务上限被拒绝，worker_id 为被拒绝的工人）
+    action = db.Column(db.String(30), nullable=False)
+    stage = db.Column(db.Integer, nullable=False)  # 事件发生后任务所处阶段
+    worker_id = db.Column(db.Integer, db.ForeignKey('workers.worker_id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
 class AlertModel(db.Model):
     """告警记录模型"""
     __tablename__ = 'alerts'
+    __table_args__ = (
+        db.Index('ix_alerts_task_type_read', 'task_id', 'type', 'is_read'),
+        db.Index('ix_alerts_type_read_created', 'type', 'is_read', 'created_at'),
+        db.Index('ix_alerts_read_created', 'is_read', 'created_at'),
+        db.Index('ix_alerts_created_at', 'created_at'),
+    )
     alert_id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(50), nullable=False)  # timeout, abnormal_fast, backlog, low_efficiency
     level = db.Column(db.String(20), nullable=False)  # high, medium, low
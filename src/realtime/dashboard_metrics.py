@@ -1,8 +1,22 @@
 """实时数据看板指标计算模块"""
+import time
+from threading import Lock
 from datetime import datetime, timedelta
-from models import PrescriptionModel, TaskModel, WorkerModel
+from flask import current_app
+from models import TaskModel
+from realtime.metrics_store import metrics_store
+from services.assignment_service import assignment_engine, AssignmentService
+from services.backlog_estimator import backlog_estimator
+from database import hour_bucket, day_bucket
+from exts import db, read_only
 from sqlalchemy import func
 
+# 趋势分桶：(SQL分桶表达式, 分桶键格式, 展示标签格式, 分桶步长)
+TREND_BUCKETS = {
+    'hour': (hour_bucket, '%Y-%m-%d %H:00', '%H:00', timedelta(hours=1)),
+    'day': (day_bucket, '%Y-%m-%d', '%m-%d', timedelta(days=1)),
+}
+
 class DashboardMetrics:
     """看板指标计算器"""
 
@@ -14,111 +28,96 @@ class DashboardMetrics:
             "metrics": DashboardMetrics.get_core_metrics(),
             "stage_distribution": DashboardMetrics.get_stage_distribution(),
             "worker_efficiency": DashboardMetrics.get_worker_efficiency(),
+            "assignment_status": DashboardMetrics.get_assignment_status(),
+            "backlog": DashboardMetrics.get_backlog_estimate(),
             "hourly_stats": DashboardMetrics.get_hourly_stats()
         }
 
     @staticmethod
     def get_core_metrics():
-        """获取核心指标"""
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-
-        return {
-            "total_prescriptions": PrescriptionModel.query.count(),
-            "today_prescriptions": PrescriptionModel.query.filter(
-                PrescriptionModel.date >= today_start
-            ).count(),
-            "pending_tasks": TaskModel.query.filter_by(status='未完成').count(),
-            "completed_today": TaskModel.query.filter(
-                TaskModel.status == '完成',
-                TaskModel.decoction_end_time >= today_start
-            ).count(),
-            "total_tasks": TaskModel.query.count()
-        }
+        """获取核心指标（读取内存计数）"""
+        metrics_store.ensure_fresh()
+        return metrics_store.core_metrics()
 
     @staticmethod
     def get_stage_distribution():
-        """获取任务阶段分布"""
-        # 待收方：receive_time为空
-        receive_pending = TaskModel.query.filter(
-            TaskModel.receive_time.is_(None),
-            TaskModel.status == '未完成'
-        ).count()
-
-        # 待配方：receive_time有值，form_time为空
-        formulate_pending = TaskModel.query.filter(
-            TaskModel.receive_time.isnot(None),
-            TaskModel.form_time.is_(None),
-            TaskModel.status == '未完成'
-        ).count()
-
-        # 待煎药：form_time有值，decoction_end_time为空
-        decoction_pending = TaskModel.query.filter(
-            TaskModel.form_time.isnot(None),
-            TaskModel.decoction_end_time.is_(None),
-            TaskModel.status == '未完成'
-        ).count()
+        """获取任务阶段分布（读取内存计数）
 
-        return {
-            "receive": receive_pending,
-            "formulate": formulate_pending,
-            "decoction": decoction_pending
-        }
+        receive: 待收方；formulate: 待配方；decoction: 待煎药与煎药中
+        """
+        metrics_store.ensure_fresh()
+        return metrics_store.stage_distribution()
 
     @staticmethod
     def get_worker_efficiency():
         """获取工人效率排行（今日完成任务数）"""
-        workers = WorkerModel.query.all()
-        efficiency = []
-
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-
-        for worker in workers:
-            # 统计今日完成的任务
-            completed_tasks = TaskModel.query.filter(
-                (
-                    (TaskModel.receive_worker_id == worker.worker_id) |
-                    (TaskModel.form_worker_id == worker.worker_id) |
-                    (TaskModel.decoction_worker_id == worker.worker_id)
-                ),
-                TaskModel.status == '完成',
-                TaskModel.decoction_end_time >= today_start
-            ).count()
-
-            efficiency.append({
-                "worker_id": worker.worker_id,
-                "name": worker.name,
-                "completed_count": completed_tasks
-            })
+        metrics_store.ensure_fresh()
+        efficiency = [{
+            "worker_id": worker_id,
+            "name": name,
+            "completed_count": completed_count
+        } for worker_id, name, completed_count in metrics_store.worker_efficiency()]
 
         # 按完成数量降序排序，取前5名
         return sorted(efficiency, key=lambda x: x['completed_count'], reverse=True)[:5]
 
     @staticmethod
-    def get_hourly_stats():
-        """获取最近24小时的任务完成趋势"""
-        now = datetime.now()
-        hours = []
-        completed = []
+    def get_backlog_estimate():
+        """以当前处理速度清空积压的预计时间（见 BacklogEstimator.estimate）"""
+        return backlog_estimator.estimate()
 
-        for i in range(24, 0, -1):
-            hour_start = now - timedelta(hours=i)
-            hour_end = now - timedelta(hours=i-1)
+    @staticmethod
+    def get_assignment_status():
+        """各工序的排队与在制任务上限情况
+
+        waiting: 等待分配工人的任务数；open: 进行中的任务数；limit: 默认上限（0 为不限制）；
+        at_limit / workers: 已达上限的工人数 / 工人总数；rejected_today: 今日因达到上限被拒绝的分配次数
+        """
+        status = assignment_engine.wip_status()
+        for phase, waiting in AssignmentService.get_waiting_counts().items():
+            status[phase]["waiting"] = waiting
+        # 拒绝记录在任务事件表中，各进程看到相同的计数（任务事件时间为UTC）
+        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        for phase, rejected in AssignmentService.get_rejected_counts(today_start).items():
+            status[phase]["rejected_today"] = rejected
+        return status
 
-            count = TaskModel.query.filter(
-                TaskModel.status == '完成',
-                TaskModel.decoction_end_time >= hour_start,
-                TaskModel.decoction_end_time < hour_end
-            ).count()
+    @staticmethod
+    @read_only()
+    def get_hourly_stats(window=timedelta(hours=24), bucket='hour'):
+        """获取任务完成趋势（默认最近24小时，按小时分桶）
 
-            hours.append(hour_start.strftime('%H:00'))
-            completed.append(count)
+        Args:
+            window: 统计时间窗口，如 timedelta(days=7)
+            bucket: 分桶粒度，'hour' 或 'day'
+
+        一条 GROUP BY 查询得到所有分桶的完成数，没有完成任务的分桶在Python中补0。
+        返回的 hours 为各分桶标签。
+        """
+        bucket_expr, key_format, label_format, step = TREND_BUCKETS[bucket]
+        bucket_count = max(1, int(window / step))
+
+        now = datetime.now()
+        if bucket == 'hour':
+            current = now.replace(minute=0, second=0, microsecond=0)
+        else:
+            current = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        starts = [current - step * i for i in range(bucket_count - 1, -1, -1)]
+
+        bucket_key = bucket_expr(TaskModel.decoction_end_time)
+        rows = db.session.query(bucket_key, func.count()).filter(
+            TaskModel.status == '完成',
+            TaskModel.decoction_end_time >= starts[0]
+        ).group_by(bucket_key).all()
+        counts = dict(rows)
 
         return {
-            "hours": hours,
-            "completed": completed
+            "hours": [start.strftime(label_format) for start in starts],
+            "completed": [counts.get(start.strftime(key_format), 0) for start in starts]
         }
 
     @staticmethod
+    @read_only()
     def get_average_processing_time():
         """计算平均处理时间"""
         completed_tasks = TaskModel.query.filter(
@@ -144,3 +143,53 @@ class DashboardMetrics:
             "fastest_minutes": round(min(processing_times), 1),
             "slowest_minutes": round(max(processing_times), 1)
         }
+
+
+class DashboardSnapshotCache:
+    """进程内共享的看板快照缓存
+
+    快照在 DASHBOARD_SNAPSHOT_TTL 秒内直接复用；过期后只有一个线程重新计算，
+    其余并发调用方等待并共享同一次计算结果。任务状态变化时可调用 invalidate() 使其立即过期。
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._entry = None  # (snapshot, expires_at)
+        self._generation = 0
+
+    def _fresh(self):
+        entry = self._entry
+        if entry is not None and time.monotonic() < entry[1]:
+            return entry[0]
+        return None
+
+    def get(self, ttl=None):
+        """获取看板快照，过期时重新计算"""
+        snapshot = self._fresh()
+        if snapshot is not None:
+            return snapshot
+
+        if ttl is None:
+            ttl = current_app.config.get('DASHBOARD_SNAPSHOT_TTL', 5)
+
+        with self._lock:
+            # 等待锁期间其他线程可能已完成计算
+            snapshot = self._fresh()
+            if snapshot is not None:
+                return snapshot
+
+            generation = self._generation
+            snapshot = DashboardMetrics.get_dashboard_data()
+            # 计算期间被invalidate的快照只返回给本轮调用方，不再缓存
+            expires_at = time.monotonic() + ttl if generation == self._generation else 0
+            self._entry = (snapshot, expires_at)
+            return snapshot
+
+    def invalidate(self):
+        """使当前快照失效，下一次读取将重新计算"""
+        self._generation += 1
+        self._entry = None
+
+
+# 进程级快照缓存实例
+dashboard_snapshot = DashboardSnapshotCache()
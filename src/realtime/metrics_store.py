@@ -0,0 +1,165 @@
+"""看板指标增量存储
+
+启动时从数据库加载一次计数，之后由任务状态变化增量维护，看板读取只访问内存。
+计数定期（METRICS_RECONCILE_INTERVAL 秒）以及跨天时与数据库重新对账，
+以纠正其他进程写入或直接修改数据库造成的偏差。
+"""
+import time
+from collections import namedtuple
+from threading import Lock
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func
+from models import PrescriptionModel, TaskModel, TaskStage, WorkerModel
+from services.task_service import TaskService
+from exts import db
+
+# 影响看板计数的任务状态
+TaskState = namedtuple('TaskState', ['pending', 'stage', 'completed_at', 'worker_ids'])
+
+STAGES = ('receive', 'formulate', 'decoction')
+
+# TaskModel.stage 到看板阶段的映射（待煎药与煎药中合并为 decoction）
+STAGE_KEYS = {
+    TaskStage.RECEIVE: 'receive',
+    TaskStage.FORMULATE: 'formulate',
+    TaskStage.DECOCTION: 'decoction',
+    TaskStage.DECOCTING: 'decoction',
+}
+
+
+def _today_start():
+    return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def capture_task_state(task):
+    """提取任务当前的计数状态"""
+    stage = STAGE_KEYS.get(task.stage)
+    completed_at = task.decoction_end_time if task.stage == TaskStage.COMPLETED else None
+    worker_ids = frozenset(
+        worker_id for worker_id in (
+            task.receive_worker_id, task.form_worker_id, task.decoction_worker_id
+        ) if worker_id is not None
+    )
+    return TaskState(stage is not None, stage, completed_at, worker_ids)
+
+
+class MetricsStore:
+    """看板计数的内存存储"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._seeded = False
+        self._reconciled_at = 0.0
+        self._today_start = None
+        self.total_prescriptions = 0
+        self.today_prescriptions = 0
+        self.total_tasks = 0
+        self.pending_tasks = 0
+        self.stage_counts = dict.fromkeys(STAGES, 0)
+        self.completed_today = 0
+        self.worker_completions = {}
+        self.worker_names = {}
+
+    def reconcile(self):
+        """从数据库重新加载全部计数（需要应用上下文）"""
+        today_start = _today_start()
+        stage_rows = db.session.query(TaskModel.stage, func.count()).filter(
+            TaskModel.stage < TaskStage.COMPLETED
+        ).group_by(TaskModel.stage).all()
+
+        totals = {
+            "total_prescriptions": PrescriptionModel.query.count(),
+            "today_prescriptions": PrescriptionModel.query.filter(
+                PrescriptionModel.date >= today_start
+            ).count(),
+            "total_tasks": TaskModel.query.count(),
+            "completed_today": TaskModel.query.filter(
+                TaskModel.status == '完成',
+                TaskModel.decoction_end_time >= today_start
+            ).count(),
+        }
+        worker_completions = TaskService.get_completed_counts_by_worker(today_start)
+        worker_names = dict(db.session.query(WorkerModel.worker_id, WorkerModel.name))
+
+        with self._lock:
+            self._today_start = today_start
+            self.total_prescriptions = totals['total_prescriptions']
+            self.today_prescriptions = totals['today_prescriptions']
+            self.total_tasks = totals['total_tasks']
+            self.completed_today = totals['completed_today']
+            self.stage_counts = dict.fromkeys(STAGES, 0)
+            self.pending_tasks = 0
+            for stage, count in stage_rows:
+                self.pending_tasks += count
+                if stage in STAGE_KEYS:
+                    self.stage_counts[STAGE_KEYS[stage]] += count
+            self.worker_completions = worker_completions
+            self.worker_names = worker_names
+            self._seeded = True
+            self._reconciled_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """首次读取、跨天或超过对账间隔时从数据库重新加载"""
+        interval = current_app.config.get('METRICS_RECONCILE_INTERVAL', 300)
+        if (not self._seeded
+                or _today_start() != self._today_start
+                or time.monotonic() - self._reconciled_at > interval):
+            self.reconcile()
+
+    def _apply(self, state, sign):
+        self.total_tasks += sign
+        if state.pending:
+            self.pending_tasks += sign
+        if state.stage:
+            self.stage_counts[state.stage] += sign
+        if state.completed_at and state.completed_at >= self._today_start:
+            self.completed_today += sign
+            for worker_id in state.worker_ids:
+                self.worker_completions[worker_id] = self.worker_completions.get(worker_id, 0) + sign
+
+    def record_task_change(self, before, after):
+        """任务提交后更新计数（before为None表示新建任务）"""
+        with self._lock:
+            if not self._seeded:
+                return
+            if before is not None:
+                self._apply(before, -1)
+            if after is not None:
+                self._apply(after, 1)
+
+    def record_prescription_created(self, created_at):
+        """处方提交后更新计数"""
+        with self._lock:
+            if not self._seeded:
+                return
+            self.total_prescriptions += 1
+            if created_at and created_at >= self._today_start:
+                self.today_prescriptions += 1
+
+    def core_metrics(self):
+        with self._lock:
+            return {
+                "total_prescriptions": self.total_prescriptions,
+                "today_prescriptions": self.today_prescriptions,
+                "pending_tasks": self.pending_tasks,
+                "completed_today": self.completed_today,
+                "total_tasks": self.total_tasks
+            }
+
+    def stage_distribution(self):
+        with self._lock:
+            return dict(self.stage_counts)
+
+    def worker_efficiency(self):
+        """所有工人的今日完成数：[(worker_id, name, completed_count)]"""
+        with self._lock:
+            worker_ids = set(self.worker_names) | set(self.worker_completions)
+            return [
+                (worker_id, self.worker_names.get(worker_id), self.worker_completions.get(worker_id, 0))
+                for worker_id in worker_ids
+            ]
+
+
+# 进程级指标存储实例
+metrics_store = MetricsStore()
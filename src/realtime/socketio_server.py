@@ -4,7 +4,8 @@ from flask import session
 from threading import Thread
 import time
 from datetime import datetime
-from realtime.dashboard_metrics import DashboardMetrics
+from realtime.dashboard_metrics import dashboard_snapshot
+from realtime.metrics_store import metrics_store
 
 # SocketIO实例（将在app.py中初始化）
 socketio = None
@@ -33,7 +34,7 @@ def register_handlers():
             emit('connected', {'status': 'success', 'message': '实时数据连接成功'})
             # 立即推送当前数据
             try:
-                dashboard_data = DashboardMetrics.get_dashboard_data()
+                dashboard_data = dashboard_snapshot.get()
                 emit('dashboard_update', dashboard_data)
             except Exception as e:
                 emit('error', {'message': f'获取数据失败: {str(e)}'})
@@ -51,7 +52,7 @@ def register_handlers():
         """手动请求数据更新"""
         if 'role' in session and session.get('role') == 'admin':
             try:
-                dashboard_data = DashboardMetrics.get_dashboard_data()
+                dashboard_data = dashboard_snapshot.get()
                 emit('dashboard_update', dashboard_data)
             except Exception as e:
                 emit('error', {'message': f'获取数据失败: {str(e)}'})
@@ -65,11 +66,18 @@ def start_background_push(app):
     """启动后台数据推送线程"""
     def background_push():
         """后台推送任务"""
+        # 启动时从数据库加载看板计数
+        try:
+            with app.app_context():
+                metrics_store.reconcile()
+        except Exception as e:
+            print(f"看板计数初始化失败: {str(e)}")
+
         while True:
             time.sleep(60)  # 每60秒推送一次
             try:
                 with app.app_context():
-                    dashboard_data = DashboardMetrics.get_dashboard_data()
+                    dashboard_data = dashboard_snapshot.get()
                     socketio.emit('dashboard_update', dashboard_data, room='admin')
             except Exception as e:
                 print(f"后台推送错误: {str(e)}")
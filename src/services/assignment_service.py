@@ -0,0 +1,319 @@
+"""
+任务自动分配
+按工序在内存中维护工人负载的最小堆（未完成任务数、近期完成数），
+任务进入某工序时选择负载最低且未达在制任务上限的工人，通过 TaskService.assign_worker 完成分配
+"""
+
+import heapq
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+from flask import current_app
+from sqlalchemy import func
+from models import TaskModel, TaskStage, TaskEventModel, WorkerModel
+from services.task_service import TaskService
+from exts import db
+
+# 各工序：(负责工人列, 该工序进行中的任务阶段, 完成该工序的操作)
+PHASES = {
+    'receive': (TaskModel.receive_worker_id, (TaskStage.RECEIVE,), 'receive'),
+    'formulate': (TaskModel.form_worker_id, (TaskStage.FORMULATE,), 'formulate'),
+    'decoction': (TaskModel.decoction_worker_id, (TaskStage.DECOCTION, TaskStage.DECOCTING), 'decoction_end'),
+}
+
+# 任务进入该阶段时需要分配工人的工序（煎药中的任务必然已分配煎药工人）
+STAGE_PHASES = {
+    TaskStage.RECEIVE: 'receive',
+    TaskStage.FORMULATE: 'formulate',
+    TaskStage.DECOCTION: 'decoction',
+}
+
+COMPLETING_ACTIONS = {action: phase for phase, (_, _, action) in PHASES.items()}
+
+PHASE_LABELS = {'receive': '收方', 'formulate': '配方', 'decoction': '煎药'}
+
+
+class WorkerLoadHeap:
+    """单个工序的工人负载最小堆
+
+    排序键为 (未完成任务数, -近期完成数, worker_id)：未完成最少者优先，相同时近期完成多者优先。
+    负载变化时压入新条目，旧条目在到达堆顶时按当前负载判断为过期并丢弃。
+    """
+
+    def __init__(self, loads):
+        self.loads = dict(loads)  # worker_id -> (未完成任务数, 近期完成数)
+        self._heap = [(open_count, -done, worker_id) for worker_id, (open_count, done) in self.loads.items()]
+        heapq.heapify(self._heap)
+
+    def copy(self):
+        heap = WorkerLoadHeap.__new__(WorkerLoadHeap)
+        heap.loads = dict(self.loads)
+        heap._heap = list(self._heap)
+        return heap
+
+    def peek(self):
+        """负载最低的工人ID（没有工人时返回None）"""
+        while self._heap:
+            open_count, neg_done, worker_id = self._heap[0]
+            if self.loads.get(worker_id) == (open_count, -neg_done):
+                return worker_id
+            heapq.heappop(self._heap)
+        return None
+
+    def adjust(self, worker_id, open_delta=0, done_delta=0):
+        if worker_id not in self.loads:
+            return
+        open_count, done = self.loads[worker_id]
+        self.loads[worker_id] = (max(open_count + open_delta, 0), done + done_delta)
+        heapq.heappush(self._heap, (self.loads[worker_id][0], -self.loads[worker_id][1], worker_id))
+        # 过期条目过多时重建，避免堆无限增长
+        if len(self._heap) > 4 * len(self.loads) + 16:
+            self.__init__(self.loads)
+
+
+class AssignmentEngine:
+    """各工序工人负载的内存存储，定期与数据库对账，分配与完成时增量更新"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._seeded = False
+        self._reconciled_at = 0.0
+        self._heaps = {}
+        self.worker_names = {}
+        self.worker_limits = {}     # worker_id -> {工序: 工人单独设置的在制任务上限}
+
+    def reconcile(self):
+        """从数据库重新加载各工人的未完成任务数与近期完成数（需要应用上下文）"""
+        window = current_app.config.get('ASSIGNMENT_THROUGHPUT_WINDOW', 3600)
+        since = datetime.utcnow() - timedelta(seconds=window)
+        workers = db.session.query(
+            WorkerModel.worker_id, WorkerModel.name,
+            *(getattr(WorkerModel, f'wip_limit_{phase}') for phase in PHASES)
+        ).all()
+        worker_names = {worker_id: name for worker_id, name, *_ in workers}
+        worker_limits = {
+            worker_id: {phase: limit for phase, limit in zip(PHASES, limits) if limit is not None}
+            for worker_id, _, *limits in workers
+        }
+
+        open_counts = {}
+        for phase, (column, stages, _) in PHASES.items():
+            open_counts[phase] = dict(db.session.query(column, func.count()).filter(
+                column.isnot(None), TaskModel.stage.in_(stages)
+            ).group_by(column).all())
+
+        done_counts = {phase: {} for phase in PHASES}
+        rows = db.session.query(TaskEventModel.action, TaskEventModel.worker_id, func.count()).filter(
+            TaskEventModel.action.in_(COMPLETING_ACTIONS),
+            TaskEventModel.created_at >= since
+        ).group_by(TaskEventModel.action, TaskEventModel.worker_id).all()
+        for action, worker_id, count in rows:
+            done_counts[COMPLETING_ACTIONS[action]][worker_id] = count
+
+        heaps = {
+            phase: WorkerLoadHeap({
+                worker_id: (open_counts[phase].get(worker_id, 0), done_counts[phase].get(worker_id, 0))
+                for worker_id in worker_names
+            })
+            for phase in PHASES
+        }
+        with self._lock:
+            self._heaps = heaps
+            self.worker_names = worker_names
+            self.worker_limits = worker_limits
+            self._seeded = True
+            self._reconciled_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """首次使用或超过对账间隔时从数据库重新加载"""
+        interval = current_app.config.get('METRICS_RECONCILE_INTERVAL', 300)
+        if not self._seeded or time.monotonic() - self._reconciled_at > interval:
+            self.reconcile()
+
+    def invalidate(self):
+        """负载无法增量推算时（如回退、修改工人上限），下次使用前重新对账"""
+        self._seeded = False
+
+    def wip_limit(self, phase, worker_id):
+        """工人在该工序的在制任务上限，0 表示不限制"""
+        limit = self.worker_limits.get(worker_id, {}).get(phase)
+        if limit is None:
+            limit = current_app.config.get('WIP_LIMITS', {}).get(phase, 0)
+        return limit
+
+    def _under_limit(self, phase, heap, worker_id):
+        limit = self.wip_limit(phase, worker_id)
+        return not limit or heap.loads[worker_id][0] < limit
+
+    def available_worker(self, phase, heap):
+        """负载堆中负载最低且未达上限的工人ID（都已达上限或没有工人时返回None）"""
+        worker_id = heap.peek()
+        if worker_id is None or self._under_limit(phase, heap, worker_id):
+            return worker_id
+        # 负载最低的工人已达上限时，其他工人可能单独设置了更高的上限
+        candidates = [
+            (open_count, -done, worker_id) for worker_id, (open_count, done) in heap.loads.items()
+            if self._under_limit(phase, heap, worker_id)
+        ]
+        return min(candidates)[2] if candidates else None
+
+    def pick(self, phase):
+        """该工序当前负载最低且未达上限的工人ID"""
+        self.ensure_fresh()
+        with self._lock:
+            return self.available_worker(phase, self._heaps[phase])
+
+    def wip_status(self):
+        """各工序的在制任务上限使用情况：{工序: {"limit", "open", "at_limit", "workers"}}"""
+        self.ensure_fresh()
+        with self._lock:
+            status = {}
+            for phase, heap in self._heaps.items():
+                status[phase] = {
+                    "limit": current_app.config.get('WIP_LIMITS', {}).get(phase, 0),
+                    "open": sum(open_count for open_count, _ in heap.loads.values()),
+                    "at_limit": sum(not self._under_limit(phase, heap, worker_id) for worker_id in heap.loads),
+                    "workers": len(heap.loads),
+                }
+            return status
+
+    def snapshot(self):
+        """各工序负载堆的副本，用于规划而不影响当前负载"""
+        self.ensure_fresh()
+        with self._lock:
+            return {phase: heap.copy() for phase, heap in self._heaps.items()}
+
+    def record_assigned(self, phase, stage, old_worker_id, new_worker_id):
+        """分配提交后更新负载（只统计该工序尚未完成的任务）"""
+        if stage not in PHASES[phase][1]:
+            return
+        with self._lock:
+            if not self._seeded or old_worker_id == new_worker_id:
+                return
+            if old_worker_id is not None:
+                self._heaps[phase].adjust(old_worker_id, open_delta=-1)
+            self._heaps[phase].adjust(new_worker_id, open_delta=1)
+
+    def record_completed(self, action, worker_id):
+        """工人完成某工序后更新负载"""
+        phase = COMPLETING_ACTIONS.get(action)
+        with self._lock:
+            if phase is None or not self._seeded:
+                return
+            self._heaps[phase].adjust(worker_id, open_delta=-1, done_delta=1)
+
+
+# 进程级工人负载实例
+assignment_engine = AssignmentEngine()
+
+
+class AssignmentService:
+    @staticmethod
+    def auto_assign_next(task):
+        """开启自动分配时，为刚进入新阶段且该工序尚未分配工人的任务分配负载最低的工人
+
+        task 可以是任务对象或含相同列的查询结果行。以任务当时的版本号分配，
+        期间任务已被修改时放弃，自动分配失败不影响已提交的操作。
+
+        Returns:
+            分配后的任务，未分配时返回None
+        """
+        if not current_app.config.get('AUTO_ASSIGN'):
+            return None
+        phase = STAGE_PHASES.get(task.stage)
+        if phase is None or getattr(task, PHASES[phase][0].key) is not None:
+            return None
+
+        worker_id = assignment_engine.pick(phase)
+        if worker_id is None:
+            return None
+        try:
+            return TaskService.assign_worker(task.task_id, worker_id, phase, task.version_id)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def get_waiting_counts():
+        """各工序已进入该工序但尚未分配工人、排队等待的任务数"""
+        return {
+            phase: db.session.query(func.count()).select_from(TaskModel).filter(
+                TaskModel.stage == stages[0], column.is_(None)
+            ).scalar()
+            for phase, (column, stages, _) in PHASES.items()
+        }
+
+    @staticmethod
+    def get_rejected_counts(since):
+        """各工序自指定时间起因工人达到在制任务上限被拒绝的分配次数
+
+        按 (action, created_at) 索引读取 wip_rejected 事件，事件中的任务阶段对应被拒绝分配的工序
+        """
+        rows = db.session.query(TaskEventModel.stage, func.count()).filter(
+            TaskEventModel.action == 'wip_rejected',
+            TaskEventModel.created_at >= since
+        ).group_by(TaskEventModel.stage).all()
+        counts = dict.fromkeys(PHASES, 0)
+        for stage, count in rows:
+            for phase, (_, stages, _) in PHASES.items():
+                if stage in stages:
+                    counts[phase] += count
+        return counts
+
+    @staticmethod
+    def plan_backlog(limit=None):
+        """为未分配工人的积压任务规划分配（不写入数据库，也不改变当前负载）
+
+        按优先级从最紧急的任务开始，依次分配给当时负载最低且未达上限的工人；
+        所有工人都已达上限时，该工序剩余任务继续排队等待。
+
+        Args:
+            limit: 每个工序最多规划的任务数
+
+        Returns:
+            list: [{"task_id", "phase", "worker_id", "worker_name", "version_id"}]
+        """
+        heaps = assignment_engine.snapshot()
+        plan = []
+        for phase, (column, stages, _) in PHASES.items():
+            query = db.session.query(TaskModel.task_id, TaskModel.version_id).filter(
+                TaskModel.stage == stages[0], column.is_(None)
+            ).order_by(TaskModel.priority_score, TaskModel.task_id)
+            if limit:
+                query = query.limit(limit)
+
+            heap = heaps[phase]
+            for task_id, version_id in query:
+                worker_id = assignment_engine.available_worker(phase, heap)
+                if worker_id is None:
+                    break
+                heap.adjust(worker_id, open_delta=1)
+                plan.append({
+                    "task_id": task_id,
+                    "phase": phase,
+                    "worker_id": worker_id,
+                    "worker_name": assignment_engine.worker_names.get(worker_id),
+                    "version_id": version_id,
+                })
+        return plan
+
+    @staticmethod
+    def assign_backlog(dry_run=False, limit=None):
+        """为未分配工人的积压任务批量分配
+
+        dry_run 为真时只返回分配计划；否则逐条分配，单条失败（如期间已被他人分配）不影响其他条目。
+
+        Returns:
+            list: plan_backlog 的结果，执行时每条追加 "success" 与 "message"
+        """
+        plan = AssignmentService.plan_backlog(limit)
+        if dry_run:
+            return plan
+
+        for item in plan:
+            try:
+                TaskService.assign_worker(item['task_id'], item['worker_id'], item['phase'], item['version_id'])
+            except ValueError as e:
+                item.update(success=False, message=str(e))
+            else:
+                item.update(success=True, message='分配成功')
+        return plan
@@ -0,0 +1,163 @@
+"""
+积压清空时间预估
+从任务事件中增量维护滚动窗口内的处方到达数与各工序完成数，得到到达率与各工序处理率；
+结合看板计数中各工序当前的任务数，估计以当前处理速度清空积压所需的时间
+"""
+
+from collections import deque
+from datetime import datetime, timedelta
+from threading import Lock
+from flask import current_app
+from sqlalchemy import func
+from models import TaskEventModel, TaskStage
+from services.task_service import TaskService
+from services.pickup_estimator import PHASE_LEAVING_ACTIONS
+from realtime.metrics_store import metrics_store, STAGES, STAGE_KEYS
+from exts import db
+
+# 每次读取的事件数
+EVENT_BATCH_SIZE = 1000
+
+
+class BacklogEstimator:
+    """按任务事件高水位增量更新的滚动到达率与处理率"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._high_water = None
+        self._arrivals = deque()                                # 窗口内新建任务的时间
+        self._departures = {phase: deque() for phase in STAGES}  # 工序 -> 窗口内完成该工序的 (时间, task_id)
+
+    def _window(self):
+        return current_app.config.get('BACKLOG_RATE_WINDOW', 3600)
+
+    def refresh(self):
+        """读取高水位之后的新事件（需要应用上下文）
+
+        首次读取时从窗口起点开始：按 (action, created_at) 索引找到窗口内第一条相关事件。
+        """
+        if self._high_water is None:
+            since = datetime.utcnow() - timedelta(seconds=self._window())
+            first = db.session.query(func.min(TaskEventModel.event_id)).filter(
+                TaskEventModel.action.in_(['create', *PHASE_LEAVING_ACTIONS]),
+                TaskEventModel.created_at >= since
+            ).scalar()
+            if first is None:
+                first = (db.session.query(func.max(TaskEventModel.event_id)).scalar() or 0) + 1
+            self._high_water = first - 1
+
+        while True:
+            events = TaskService.get_events_since(self._high_water, limit=EVENT_BATCH_SIZE)
+            with self._lock:
+                for event in events:
+                    if event.event_id > self._high_water:
+                        self._consume(event)
+                        self._high_water = event.event_id
+            if len(events) < EVENT_BATCH_SIZE:
+                break
+
+    def _consume(self, event):
+        if event.action == 'create':
+            self._arrivals.append(event.created_at)
+        elif event.action in PHASE_LEAVING_ACTIONS:
+            self._departures[PHASE_LEAVING_ACTIONS[event.action]].append((event.created_at, event.task_id))
+        elif event.action.startswith('rollback_') and event.action[len('rollback_'):] in STAGES:
+            # 回退到某工序撤销了该任务在该工序及之后各工序的完成，从窗口中去掉其最近一次完成记录
+            phase = event.action[len('rollback_'):]
+            for undone in STAGES[STAGES.index(phase):]:
+                departures = self._departures[undone]
+                for i in range(len(departures) - 1, -1, -1):
+                    if departures[i][1] == event.task_id:
+                        del departures[i]
+                        break
+
+    def _counts(self, now):
+        """滚动窗口内的到达数与各工序完成数"""
+        since = now - timedelta(seconds=self._window())
+        with self._lock:
+            while self._arrivals and self._arrivals[0] < since:
+                self._arrivals.popleft()
+            for departures in self._departures.values():
+                while departures and departures[0][0] < since:
+                    departures.popleft()
+            return len(self._arrivals), {phase: len(departures) for phase, departures in self._departures.items()}
+
+    @staticmethod
+    def expected_rate(phase):
+        """按配置的预计耗时（STAGE_EXPECTED_MINUTES）估计的工序处理率（单/小时）
+
+        煎煮在煎药锅中进行、不占用工人，不计入煎药工序的耗时。
+        """
+        seconds = sum(
+            TaskService.expected_stage_seconds(stage) for stage, key in STAGE_KEYS.items()
+            if key == phase and stage != TaskStage.DECOCTING
+        )
+        return 3600 / seconds if seconds else None
+
+    def estimate(self, now=None):
+        """预估以当前处理速度清空积压所需的时间
+
+        任务按收方、配方、煎药依次经过各工序，某工序及其之前各工序中的任务都要经过该工序，
+        以该工序的处理率全部处理完所需的时间中最长者即为清空时间，对应工序为瓶颈。
+        窗口内完成数少于 BACKLOG_MIN_COMPLETIONS 的工序样本不足，处理率按配置的预计耗时估计；
+        窗口内没有完成记录、且该工序待处理任务不少于 BACKLOG_STALL_PENDING 的工序视为无法清空。
+
+        Returns:
+            dict: {"drain_minutes"（无法清空时为None）, "stalled", "bottleneck", "arrival_rate",
+                   "growing"（到达率高于瓶颈处理率）, "sla_minutes", "breached",
+                   "phases": {工序: {"pending", "upstream", "completed", "service_rate",
+                                     "rate_source"（observed/expected）, "drain_minutes"}}}
+        """
+        now = now or datetime.utcnow()
+        self.refresh()
+        metrics_store.ensure_fresh()
+        hours = self._window() / 3600
+        arrivals, completed = self._counts(now)
+        arrival_rate = arrivals / hours
+        pending = metrics_store.stage_distribution()
+        min_completions = current_app.config.get('BACKLOG_MIN_COMPLETIONS', 5)
+        stall_pending = current_app.config.get('BACKLOG_STALL_PENDING', 20)
+
+        phases = {}
+        upstream = 0
+        drain, stalled, bottleneck = 0.0, False, None
+        for phase in STAGES:
+            upstream += pending[phase]
+            rate, source = completed[phase] / hours, 'observed'
+            phase_stalled = not completed[phase] and pending[phase] >= stall_pending
+            if not phase_stalled and completed[phase] < min_completions and self.expected_rate(phase):
+                rate, source = self.expected_rate(phase), 'expected'
+            if phase_stalled:
+                minutes = None
+            else:
+                # 既无足够样本也未配置预计耗时的工序无法估计，不参与清空时间
+                minutes = upstream / rate * 60 if rate else 0.0
+            phases[phase] = {
+                "pending": pending[phase],
+                "upstream": upstream,
+                "completed": completed[phase],
+                "service_rate": rate,
+                "rate_source": source,
+                "drain_minutes": minutes,
+            }
+            if minutes is None:
+                if not stalled:
+                    stalled, bottleneck = True, phase
+            elif not stalled and minutes > drain:
+                drain, bottleneck = minutes, phase
+
+        sla = current_app.config.get('BACKLOG_SLA_MINUTES', 120)
+        return {
+            "drain_minutes": None if stalled else drain,
+            "stalled": stalled,
+            "bottleneck": bottleneck,
+            "arrival_rate": arrival_rate,
+            "growing": bottleneck is not None and arrival_rate > phases[bottleneck]["service_rate"],
+            "sla_minutes": sla,
+            "breached": stalled or drain > sla,
+            "phases": phases,
+        }
+
+
+# 进程级预估实例
+backlog_estimator = BacklogEstimator()
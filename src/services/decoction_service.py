@@ -0,0 +1,158 @@
+"""
+煎药锅容量与排程
+按煎药锅槽位与煎煮周期，把待煎药任务按优先级依次排入最早空出的槽位，给出预计开始与完成时间；
+开始煎药时占用一个空闲槽位，完成煎药后释放
+"""
+
+import heapq
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func
+from sqlalchemy.orm import aliased
+from models import DecoctionPotModel, TaskModel, TaskStage
+from exts import db
+
+POTS_FULL_MESSAGE = '煎药锅已全部占满，请等待空出后再开始煎药!'
+
+
+class DecoctionService:
+    @staticmethod
+    def create_pot(name, slots, cycle_minutes):
+        """新增煎药锅"""
+        if not name:
+            raise ValueError('请填写煎药锅名称!')
+        if slots < 1 or cycle_minutes < 1:
+            raise ValueError('槽位数与煎煮周期必须为正整数!')
+        pot = DecoctionPotModel(name=name, slots=slots, cycle_minutes=cycle_minutes, is_active=True)
+        db.session.add(pot)
+        db.session.commit()
+        return pot
+
+    @staticmethod
+    def set_pot_active(pot_id, is_active):
+        """启用或停用煎药锅（停用的锅不再接受新的煎药任务）"""
+        pot = DecoctionPotModel.query.get_or_404(pot_id)
+        pot.is_active = is_active
+        db.session.commit()
+        return pot
+
+    @staticmethod
+    def get_pot_usage(include_inactive=False):
+        """煎药锅及其正在煎煮的任务数：[(DecoctionPotModel, 占用槽位数)]"""
+        query = db.session.query(DecoctionPotModel, func.count(TaskModel.task_id)).outerjoin(
+            TaskModel, and_(TaskModel.pot_id == DecoctionPotModel.pot_id,
+                            TaskModel.stage == TaskStage.DECOCTING)
+        )
+        if not include_inactive:
+            query = query.filter(DecoctionPotModel.is_active.is_(True))
+        return query.group_by(DecoctionPotModel.pot_id).order_by(DecoctionPotModel.pot_id).all()
+
+    @staticmethod
+    def reserve_pot():
+        """开始煎药时占用的煎药锅：有空闲槽位的启用中的锅里编号最小者（不提交）
+
+        候选锅先以 SELECT ... FOR UPDATE 锁定，再重新统计其占用槽位：同一口锅上并发的开始煎药
+        依次拿到行锁，后到者在前者提交后才计数，READ COMMITTED 下也不会超出槽位数。
+        锁在调用方事务提交或回滚时释放。
+
+        Returns:
+            pot_id；未配置任何启用中的煎药锅时返回None（不做容量限制）
+
+        Raises:
+            ValueError: 所有煎药锅都已占满
+        """
+        usage = DecoctionService.get_pot_usage()
+        if not usage:
+            return None
+        for pot, in_use in usage:
+            if in_use >= pot.slots:
+                continue
+            slots = db.session.execute(
+                db.select(DecoctionPotModel.slots).where(
+                    DecoctionPotModel.pot_id == pot.pot_id,
+                    DecoctionPotModel.is_active.is_(True)
+                ).with_for_update()
+            ).scalar()
+            if slots is None:
+                continue
+            in_use = db.session.execute(
+                db.select(func.count()).select_from(TaskModel).where(
+                    TaskModel.pot_id == pot.pot_id, TaskModel.stage == TaskStage.DECOCTING
+                )
+            ).scalar()
+            if in_use < slots:
+                return pot.pot_id
+        raise ValueError(POTS_FULL_MESSAGE)
+
+    @staticmethod
+    def slot_available(pot_id):
+        """该锅仍有空闲槽位（用于开始煎药的条件UPDATE，与状态转移在同一语句中再判断一次）"""
+        occupied = aliased(TaskModel)
+        in_use = db.select(func.count()).where(
+            occupied.pot_id == pot_id, occupied.stage == TaskStage.DECOCTING
+        ).scalar_subquery()
+        slots = db.select(DecoctionPotModel.slots).where(
+            DecoctionPotModel.pot_id == pot_id
+        ).scalar_subquery()
+        return in_use < slots
+
+    @staticmethod
+    def get_schedule(now=None, limit=None):
+        """煎药排程
+
+        正在煎煮的任务按开始时间加煎煮周期空出槽位；待煎药任务按优先级依次排入启用中的锅最早空出的槽位，
+        得到预计开始与完成时间。停用的锅不再排入新任务，但其中正在煎煮的任务照常列出。
+        排程只是预测，开始煎药时仍按实际空闲槽位占用。
+
+        Args:
+            limit: 最多排入的待煎药任务数
+
+        Returns:
+            dict: {"pots": [(DecoctionPotModel, 占用槽位数)]（含停用的锅）,
+                   "decocting": [{"task", "pot", "start", "end"}],
+                   "queue": [{"task", "pot", "start", "end"}]}
+        """
+        now = now or datetime.utcnow()
+        usage = DecoctionService.get_pot_usage(include_inactive=True)
+        pots = {pot.pot_id: pot for pot, _ in usage}
+        schedule = {"pots": usage, "decocting": [], "queue": []}
+        if not pots:
+            return schedule
+
+        ends = {pot_id: [] for pot_id in pots}
+        decocting = TaskModel.query.filter(
+            TaskModel.pot_id.in_(list(pots)), TaskModel.stage == TaskStage.DECOCTING
+        ).order_by(TaskModel.decoction_start_time).all()
+        for task in decocting:
+            pot = pots[task.pot_id]
+            start = task.decoction_start_time or now
+            end = start + timedelta(minutes=pot.cycle_minutes)
+            schedule["decocting"].append({"task": task, "pot": pot, "start": start, "end": end})
+            ends[pot.pot_id].append(max(end, now))
+
+        # 启用中的锅每个槽位一个条目 (空出时间, pot_id)；占用超过槽位数时（如调小了槽位）按最晚空出的计
+        slots = []
+        for pot_id, pot in pots.items():
+            if not pot.is_active:
+                continue
+            pot_ends = sorted(ends[pot_id])
+            if len(pot_ends) >= pot.slots:
+                pot_ends = pot_ends[-pot.slots:]
+            else:
+                pot_ends = [now] * (pot.slots - len(pot_ends)) + pot_ends
+            slots.extend((end, pot_id) for end in pot_ends)
+        heapq.heapify(slots)
+        if not slots:
+            return schedule
+
+        query = TaskModel.query.filter(TaskModel.stage == TaskStage.DECOCTION).order_by(
+            TaskModel.priority_score, TaskModel.task_id
+        )
+        if limit:
+            query = query.limit(limit)
+        for task in query:
+            free_at, pot_id = heapq.heappop(slots)
+            pot = pots[pot_id]
+            end = free_at + timedelta(minutes=pot.cycle_minutes)
+            schedule["queue"].append({"task": task, "pot": pot, "start": free_at, "end": end})
+            heapq.heappush(slots, (end, pot_id))
+        return schedule
@@ -0,0 +1,134 @@
+"""
+取药时间预测
+从任务事件中增量统计各阶段耗时与各工序近期出队间隔（指数加权平均），
+结合看板计数中各工序当前排队的任务数，预测任务完成（可取药）的时间
+"""
+
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+from flask import current_app
+from sqlalchemy import func
+from models import TaskStage, TaskEventModel
+from services.task_service import TaskService
+from realtime.metrics_store import metrics_store, STAGE_KEYS
+from exts import db
+
+# 指数加权平均的平滑系数：越大越偏重最近完成的任务
+EWMA_ALPHA = 0.1
+
+# 首次加载时回看的事件数，用于预热统计
+WARMUP_EVENTS = 5000
+
+# 每次读取的事件数
+EVENT_BATCH_SIZE = 1000
+
+# 工人操作 -> 离开的阶段
+LEAVING_ACTIONS = {
+    'receive': TaskStage.RECEIVE,
+    'formulate': TaskStage.FORMULATE,
+    'decoction_start': TaskStage.DECOCTION,
+    'decoction_end': TaskStage.DECOCTING,
+}
+
+# 离开工序（看板阶段）的操作：煎药工序包含待煎药与煎药中两个阶段
+PHASE_LEAVING_ACTIONS = {'receive': 'receive', 'formulate': 'formulate', 'decoction_end': 'decoction'}
+
+
+def _ewma(stats, key, value):
+    stats[key] = value if key not in stats else stats[key] + EWMA_ALPHA * (value - stats[key])
+
+
+class PickupEstimator:
+    """按任务事件高水位增量更新的阶段耗时统计"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._high_water = None
+        self._refreshed_at = 0.0
+        self._stage_seconds = {}    # TaskStage -> 任务在该阶段停留的平均秒数
+        self._phase_gaps = {}       # 工序 -> 相邻两个任务离开该工序的平均间隔秒数
+        self._last_left = {}        # 工序 -> 最近一个任务离开的时间
+        self._entered = {}          # 进行中的任务 task_id -> (阶段, 进入时间)
+
+    def refresh(self):
+        """读取高水位之后的新事件并更新统计（需要应用上下文）"""
+        if self._high_water is None:
+            latest = db.session.query(func.max(TaskEventModel.event_id)).scalar() or 0
+            self._high_water = max(latest - WARMUP_EVENTS, 0)
+
+        while True:
+            events = TaskService.get_events_since(self._high_water, limit=EVENT_BATCH_SIZE)
+            with self._lock:
+                for event in events:
+                    if event.event_id > self._high_water:
+                        self._consume(event)
+                        self._high_water = event.event_id
+            if len(events) < EVENT_BATCH_SIZE:
+                break
+        self._refreshed_at = time.monotonic()
+
+    def _consume(self, event):
+        if event.action in LEAVING_ACTIONS:
+            left = LEAVING_ACTIONS[event.action]
+            entered = self._entered.get(event.task_id)
+            if entered and entered[0] == left:
+                _ewma(self._stage_seconds, left, (event.created_at - entered[1]).total_seconds())
+
+        phase = PHASE_LEAVING_ACTIONS.get(event.action)
+        if phase:
+            last = self._last_left.get(phase)
+            if last is not None:
+                _ewma(self._phase_gaps, phase, max((event.created_at - last).total_seconds(), 0))
+            self._last_left[phase] = event.created_at
+
+        # 新建、工人操作与回退使任务（重新）进入某阶段；分配不改变阶段
+        if event.action == 'create' or event.action in LEAVING_ACTIONS or event.action.startswith('rollback_'):
+            if event.stage == TaskStage.COMPLETED:
+                self._entered.pop(event.task_id, None)
+            else:
+                self._entered[event.task_id] = (event.stage, event.created_at)
+
+    def ensure_fresh(self):
+        """首次使用或超过刷新间隔时读取新事件"""
+        interval = current_app.config.get('PICKUP_STATS_REFRESH_INTERVAL', 60)
+        if self._high_water is None or time.monotonic() - self._refreshed_at > interval:
+            self.refresh()
+
+    def stage_seconds(self, stage):
+        """任务在该阶段的预计停留秒数：有历史统计时取统计值，否则取配置的预计耗时"""
+        with self._lock:
+            seconds = self._stage_seconds.get(stage)
+        return seconds if seconds is not None else TaskService.expected_stage_seconds(stage)
+
+    def predict(self, stage, now=None, refresh=True):
+        """预测刚进入该阶段的任务的完成时间
+
+        当前工序取「典型停留时间」与「排在前面的任务按近期出队间隔全部离开所需时间」中的较大者，
+        之后各阶段取典型停留时间。
+        refresh=False 时直接使用已有统计与看板计数、不读取数据库，用于已有未提交更新的事务中：
+        此时对账会把本事务的更新计入看板计数，提交后又被增量计入一次。
+        """
+        now = now or datetime.utcnow()
+        if stage >= TaskStage.COMPLETED:
+            return now
+        if refresh:
+            self.ensure_fresh()
+
+        phase = STAGE_KEYS[stage]
+        current = [s for s in range(stage, TaskStage.COMPLETED) if STAGE_KEYS[s] == phase]
+        later = range(current[-1] + 1, TaskStage.COMPLETED)
+
+        wait = sum(self.stage_seconds(s) for s in current)
+        with self._lock:
+            gap = self._phase_gaps.get(phase)
+        if gap is not None:
+            if refresh:
+                metrics_store.ensure_fresh()
+            wait = max(wait, metrics_store.stage_distribution()[phase] * gap)
+
+        return now + timedelta(seconds=wait + sum(self.stage_seconds(s) for s in later))
+
+
+# 进程级预测实例
+pickup_estimator = PickupEstimator()
@@ -1,9 +1,11 @@
 from typing import Optional
 from datetime import datetime
-from models import PrescriptionModel, TaskModel
+from flask import current_app
+from sqlalchemy.orm import contains_eager, joinedload
+from models import PrescriptionModel
 from exts import db
-from services.task_service import TaskService
-
+from services.task_service import TaskService, STAGE_FILTERS
+from realtime.metrics_store import metrics_store
 
 class PrescriptionService:
     @staticmethod
@@ -15,19 +17,23 @@ class PrescriptionService:
         status: Optional[str] = None,
         expected_pickup_time: Optional[datetime] = None,
     ):
-        """创建处方并自动生成任务"""
+        """创建处方并自动生成任务
+
+        expected_pickup_time 是约定的取药时间（任务排序的截止时间），未填写时保持为空，
+        排序按开方后 DEFAULT_PICKUP_HOURS 小时计；预测的完成时间只写入任务的 predicted_pickup_time
+        """
         new_prescription = PrescriptionModel(
             patient_id=patient_id,
             doctor_id=doctor_id,
             amount=amount,
             usage_instructions=usage_instructions,
-            status=status or '待配方'
+            status=status or '待配方',
+            expected_pickup_time=expected_pickup_time
         )
-        if expected_pickup_time is not None:
-            new_prescription.expected_pickup_time = expected_pickup_time
 
         db.session.add(new_prescription)
         db.session.commit()
+        metrics_store.record_prescription_created(new_prescription.date)
 
         # 自动创建关联任务
         TaskService.create_task(new_prescription.prescription_id)
@@ -36,8 +42,8 @@ class PrescriptionService:
 
     @staticmethod
     def get_prescription_with_status(prescription):
-        """获取带状态的处方信息"""
-        task = TaskModel.query.filter_by(prescription_id=prescription.prescription_id).first()
+        """获取带状态的处方信息（任务通过 prescription.task 关系读取）"""
+        task = prescription.task
         status = TaskService.get_task_status(task)
         return {
             "prescription": prescription,
@@ -46,13 +52,73 @@ class PrescriptionService:
         }
 
     @staticmethod
-    def get_prescriptions_by_doctor(doctor_id):
-        """获取医生的所有处方"""
-        prescriptions = PrescriptionModel.query.filter_by(doctor_id=doctor_id).all()
-        return [PrescriptionService.get_prescription_with_status(p) for p in prescriptions]
+    def encode_cursor(prescription):
+        """由当前页最后一条处方生成下一页游标"""
+        return f"{prescription.date.isoformat()}_{prescription.prescription_id}"
 
     @staticmethod
-    def get_prescriptions_by_patient(patient_id):
-        """获取患者的所有处方"""
-        prescriptions = PrescriptionModel.query.filter_by(patient_id=patient_id).all()
-        return [PrescriptionService.get_prescription_with_status(p) for p in prescriptions]
+    def decode_cursor(cursor):
+        """解析游标为 (date, prescription_id)，格式错误时抛出 ValueError"""
+        try:
+            date, prescription_id = cursor.rsplit('_', 1)
+            return datetime.fromisoformat(date), int(prescription_id)
+        except (AttributeError, ValueError):
+            raise ValueError('无效的分页参数!')
+
+    @staticmethod
+    def paginate_prescriptions(query, status=None, cursor=None, limit=None):
+        """按 (date, prescription_id) 倒序做游标分页
+
+        下一页从上一页最后一条处方之后继续，借助 (医生/患者, date, prescription_id) 索引直接定位，
+        翻到第N页与第1页的开销相同。
+
+        Args:
+            query: 已按医生或患者过滤的处方查询
+            status: STAGE_FILTERS 中的键（任务阶段），None 表示不筛选
+            cursor: 上一页返回的 next_cursor，None 表示第一页
+            limit: 每页条数，默认使用 PRESCRIPTION_PAGE_SIZE
+
+        Returns:
+            dict: {"items": [...], "next_cursor": 下一页游标，没有下一页时为None}
+        """
+        limit = limit or current_app.config.get('PRESCRIPTION_PAGE_SIZE', 20)
+
+        if status:
+            if status not in STAGE_FILTERS:
+                raise ValueError('无效的状态筛选!')
+            query = query.join(PrescriptionModel.task).filter(
+                STAGE_FILTERS[status][1]
+            ).options(contains_eager(PrescriptionModel.task))
+        else:
+            query = query.options(joinedload(PrescriptionModel.task))
+
+        if cursor:
+            query = query.filter(
+                db.tuple_(PrescriptionModel.date, PrescriptionModel.prescription_id)
+                < PrescriptionService.decode_cursor(cursor)
+            )
+
+        prescriptions = query.order_by(
+            PrescriptionModel.date.desc(), PrescriptionModel.prescription_id.desc()
+        ).limit(limit + 1).all()
+
+        has_next = len(prescriptions) > limit
+        prescriptions = prescriptions[:limit]
+        return {
+            "items": [PrescriptionService.get_prescription_with_status(p) for p in prescriptions],
+            "next_cursor": PrescriptionService.encode_cursor(prescriptions[-1]) if has_next else None
+        }
+
+    @staticmethod
+    def get_prescriptions_by_doctor(doctor_id, status=None, cursor=None, limit=None):
+        """分页获取医生的处方（处方与任务一次外连接查询取回）"""
+        return PrescriptionService.paginate_prescriptions(
+            PrescriptionModel.query.filter_by(doctor_id=doctor_id), status, cursor, limit
+        )
+
+    @staticmethod
+    def get_prescriptions_by_patient(patient_id, status=None, cursor=None, limit=None):
+        """分页获取患者的处方（处方与任务一次外连接查询取回）"""
+        return PrescriptionService.paginate_prescriptions(
+            PrescriptionModel.query.filter_by(patient_id=patient_id), status, cursor, limit
+        )
@@ -1,11 +1,199 @@
-from datetime import datetime
-from models import TaskModel, WorkerModel, PrescriptionModel
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from flask import current_app
+from sqlalchemy import and_, false, func, or_, union
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.orm.exc import StaleDataError
+from models import TaskModel, TaskStage, TaskEventModel, WorkerModel, PrescriptionModel
+from services.decoction_service import DecoctionService, POTS_FULL_MESSAGE
 from exts import db
 
+# 按任务阶段筛选：键 -> (显示名称, 筛选条件)
+STAGE_FILTERS = {
+    'pending': ('未完成', TaskModel.stage < TaskStage.COMPLETED),
+    'receive': (TaskStage.LABELS[TaskStage.RECEIVE], TaskModel.stage == TaskStage.RECEIVE),
+    'formulate': (TaskStage.LABELS[TaskStage.FORMULATE], TaskModel.stage == TaskStage.FORMULATE),
+    'decoction': (TaskStage.LABELS[TaskStage.DECOCTION], TaskModel.stage == TaskStage.DECOCTION),
+    'decocting': (TaskStage.LABELS[TaskStage.DECOCTING], TaskModel.stage == TaskStage.DECOCTING),
+    'completed': (TaskStage.LABELS[TaskStage.COMPLETED], TaskModel.stage == TaskStage.COMPLETED),
+}
+
+# TaskModel.stage 到 STAGE_EXPECTED_MINUTES 键的映射
+STAGE_DURATION_KEYS = {
+    TaskStage.RECEIVE: 'receive',
+    TaskStage.FORMULATE: 'formulate',
+    TaskStage.DECOCTION: 'decoction',
+    TaskStage.DECOCTING: 'decocting',
+}
+
+# 任务看板排序：键 -> 排序列（均以 task_id 作为最后一列保证顺序唯一）与方向
+BOARD_SORTS = {
+    'stage': ((TaskModel.stage, TaskModel.task_id), 'asc'),
+    '-stage': ((TaskModel.stage, TaskModel.task_id), 'desc'),
+    'task_id': ((TaskModel.task_id,), 'asc'),
+    '-task_id': ((TaskModel.task_id,), 'desc'),
+}
+
+# 工人操作的状态转移：操作 -> (负责该工序的工人列, 操作前阶段, 操作后阶段, 记录完成时间的列)
+TRANSITIONS = {
+    'receive': (TaskModel.receive_worker_id, TaskStage.RECEIVE, TaskStage.FORMULATE, TaskModel.receive_time),
+    'formulate': (TaskModel.form_worker_id, TaskStage.FORMULATE, TaskStage.DECOCTION, TaskModel.form_time),
+    'decoction_start': (TaskModel.decoction_worker_id, TaskStage.DECOCTION, TaskStage.DECOCTING,
+                        TaskModel.decoction_start_time),
+    'decoction_end': (TaskModel.decoction_worker_id, TaskStage.DECOCTING, TaskStage.COMPLETED,
+                      TaskModel.decoction_end_time),
+}
+
+# 工人待办：(负责该工序的工人列, 任务阶段, 工人下一步操作)
+WORKER_ACTIONS = tuple(
+    (worker_column, from_stage, action)
+    for action, (worker_column, from_stage, _, _) in TRANSITIONS.items()
+)
+
+# 状态转移后需要取回的列（用于记录事件与更新看板计数）
+TRANSITION_RETURNING = (
+    TaskModel.task_id,
+    TaskModel.stage,
+    TaskModel.receive_worker_id,
+    TaskModel.form_worker_id,
+    TaskModel.decoction_worker_id,
+    TaskModel.decoction_end_time,
+    TaskModel.version_id,
+)
+
+ACTION_LABELS = {
+    'receive': '完成收方',
+    'formulate': '完成配方',
+    'decoction_start': '开始煎药',
+    'decoction_end': '完成煎药',
+}
+
+WORKER_COLUMNS = (TaskModel.receive_worker_id, TaskModel.form_worker_id, TaskModel.decoction_worker_id)
+
+CONFLICT_MESSAGE = '任务已被他人修改，请刷新后重试!'
+
+
+class TaskConflictError(ValueError):
+    """任务在读取后已被他人修改（乐观锁版本不匹配）"""
+
+
+class WipLimitError(ValueError):
+    """工人在该工序进行中的任务数已达上限"""
+
+
+def parse_version(value):
+    """解析客户端提交的任务版本号，未提交时返回 None（不做版本检查）"""
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError('无效的任务版本号!')
+
+def _notify_task_changed(before, after):
+    """任务提交后更新看板计数并使看板快照失效"""
+    from realtime.metrics_store import metrics_store
+    from realtime.dashboard_metrics import dashboard_snapshot
+    metrics_store.record_task_change(before, after)
+    dashboard_snapshot.invalidate()
+
+def _notify_assigned(phase, stage, old_worker_id, new_worker_id):
+    """分配提交后更新自动分配使用的工人负载"""
+    from services.assignment_service import assignment_engine
+    assignment_engine.record_assigned(phase, stage, old_worker_id, new_worker_id)
+
+def _check_wip_limit(phase, task, worker):
+    """分配前检查工人在该工序的在制任务上限，超出时记录一次拒绝并抛出 WipLimitError
+
+    在分配所在的事务中锁定工人行（SELECT ... FOR UPDATE）并按 (工人列, stage) 索引计数，
+    同一工人的并发分配依次判断，新增或刚修改上限的工人同样生效；
+    任务不处于该工序进行中的阶段（如为已完成的工序补记工人）时不受限制。
+    拒绝时回滚分配所在的事务，另行提交一条 wip_rejected 事件，供各进程统计当天的拒绝次数。
+    """
+    from services.assignment_service import PHASES, PHASE_LABELS
+    if phase not in PHASES:
+        return
+    column, stages, _ = PHASES[phase]
+    if task.stage not in stages:
+        return
+    limit = db.session.execute(
+        db.select(getattr(WorkerModel, f'wip_limit_{phase}'))
+        .where(WorkerModel.worker_id == worker.worker_id).with_for_update()
+    ).scalar()
+    if limit is None:
+        limit = current_app.config.get('WIP_LIMITS', {}).get(phase, 0)
+    if not limit:
+        return
+    open_count = db.session.execute(
+        db.select(func.count()).select_from(TaskModel).where(
+            column == worker.worker_id, TaskModel.stage.in_(stages)
+        )
+    ).scalar()
+    if open_count >= limit:
+        message = (f'工人 {worker.name} 进行中的{PHASE_LABELS[phase]}任务已达上限'
+                   f'（{limit} 个），请分配给其他工人或等待其完成后再分配!')
+        rejected = SimpleNamespace(task_id=task.task_id, stage=task.stage)
+        worker_id = worker.worker_id
+        db.session.rollback()
+        _record_event(rejected, 'wip_rejected', worker_id)
+        db.session.commit()
+        raise WipLimitError(message)
+
+def _notify_stage_entered(task, action=None, worker_id=None):
+    """任务新建或工人操作提交后更新工人负载，开启自动分配时为下一工序分配工人
+
+    Returns:
+        自动分配后的任务，未分配时返回None
+    """
+    from services.assignment_service import assignment_engine, AssignmentService
+    if action is not None:
+        assignment_engine.record_completed(action, worker_id)
+    return AssignmentService.auto_assign_next(task)
+
+def _predict_pickup(stage, now=None, refresh=True):
+    """预测刚进入该阶段的任务的完成时间（refresh 见 PickupEstimator.predict）"""
+    from services.pickup_estimator import pickup_estimator
+    return pickup_estimator.predict(stage, now, refresh)
+
+def _refresh_pickup_stats():
+    """在事务写入前刷新取药时间预测所用的统计与看板计数，之后事务中以 refresh=False 预测"""
+    from services.pickup_estimator import pickup_estimator
+    from realtime.metrics_store import metrics_store
+    pickup_estimator.ensure_fresh()
+    metrics_store.ensure_fresh()
+
+def _capture(task):
+    """记录任务用于看板计数的状态"""
+    from realtime.metrics_store import capture_task_state
+    return capture_task_state(task)
+
+def _check_version(task, version_id):
+    """客户端提交了读取时的版本号时，与当前版本比较"""
+    if version_id is not None and task.version_id != version_id:
+        raise TaskConflictError(CONFLICT_MESSAGE)
+
+def _commit_task_change():
+    """提交任务变更；期间任务被他人修改（版本不匹配）时回滚并抛出 TaskConflictError"""
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        raise TaskConflictError(CONFLICT_MESSAGE)
+
+def _record_event(task, action, worker_id=None):
+    """追加一条任务流转事件，随任务变更一起提交"""
+    db.session.add(TaskEventModel(
+        task_id=task.task_id,
+        action=action,
+        stage=task.stage,
+        worker_id=worker_id
+    ))
+
 class TaskService:
     @staticmethod
     def create_task(prescription_id):
         """创建任务"""
+        prescription = db.session.get(PrescriptionModel, prescription_id)
         new_task = TaskModel(
             prescription_id=prescription_id,
             receive_worker_id=None,
@@ -20,26 +208,47 @@ class TaskService:
             form_time=None,
             decoction_start_time=None,
             decoction_end_time=None,
-            status='未完成'
+            status='未完成',
+            stage=TaskStage.RECEIVE,
+            priority_score=TaskService.priority_score(prescription, TaskStage.RECEIVE) if prescription else None,
+            predicted_pickup_time=_predict_pickup(TaskStage.RECEIVE)
         )
         db.session.add(new_task)
+        db.session.flush()  # 取得task_id
+        _record_event(new_task, 'create')
+        after = _capture(new_task)
         db.session.commit()
+        _notify_task_changed(None, after)
+        _notify_stage_entered(new_task)
         return new_task
 
     @staticmethod
-    def assign_worker(task_id, worker_id, phase):
-        """分配工人到指定阶段"""
+    def assign_worker(task_id, worker_id, phase, version_id=None):
+        """分配工人到指定阶段
+
+        version_id 为客户端读取任务时的版本号，任务已被他人修改时抛出 TaskConflictError；
+        工人在该工序进行中的任务数已达上限时抛出 WipLimitError
+        """
         task = TaskModel.query.get_or_404(task_id)
         worker = WorkerModel.query.get_or_404(worker_id)
+        _check_version(task, version_id)
 
         # 检查任务分配规则
-        if phase == 'formulate' and not task.receive_time:
+        if phase == 'formulate' and task.stage < TaskStage.FORMULATE:
             raise ValueError('必须完成收方后才能分配配方任务!')
 
-        if phase == 'decoction' and not task.form_time:
+        if phase == 'decoction' and task.stage < TaskStage.DECOCTION:
             raise ValueError('必须完成配方后才能分配煎药任务!')
 
         # 分配任务
+        before = _capture(task)
+        old_worker_id = {
+            'receive': task.receive_worker_id,
+            'formulate': task.form_worker_id,
+            'decoction': task.decoction_worker_id,
+        }.get(phase)
+        if old_worker_id != worker_id:
+            _check_wip_limit(phase, task, worker)
         if phase == 'receive':
             task.receive_worker_id = worker_id
             task.receive_worker_name = worker.name
@@ -49,85 +258,408 @@ class TaskService:
         elif phase == 'decoction':
             task.decoction_worker_id = worker_id
             task.decoction_worker_name = worker.name
+        else:
+            raise ValueError('未知的任务阶段!')
 
-        db.session.commit()
+        _record_event(task, f'assign_{phase}', worker_id)
+        stage = task.stage
+        after = _capture(task)
+        _commit_task_change()
+        _notify_task_changed(before, after)
+        _notify_assigned(phase, stage, old_worker_id, worker_id)
         return task
 
     @staticmethod
-    def update_task_status(task_id, worker_id, action):
-        """更新任务状态"""
-        task = TaskModel.query.get_or_404(task_id)
+    def _apply_transition(task_id, worker_id, action, version_id=None):
+        """以一条条件UPDATE应用一次工人操作（不提交）
+
+        前置条件（负责工人、当前阶段、客户端提交的版本号）全部写在 WHERE 中，
+        由数据库原子地判断并更新，并发请求中只有一个能命中；
+        未更新任何行时再查一次任务给出具体原因。
+
+        Returns:
+            (before, after, row): 用于更新看板计数的前后状态，以及更新后任务的
+            task_id/stage/各工序工人/version_id 等列
+
+        Raises:
+            TaskConflictError: 任务已被他人修改
+            ValueError: 任务不存在或不满足操作条件
+        """
+        if action not in TRANSITIONS:
+            raise ValueError('当前任务未满足操作条件，无法完成此操作。')
+
+        worker_column, from_stage, to_stage, time_column = TRANSITIONS[action]
+        # 批量UPDATE不经过ORM的版本控制，需要显式递增版本号；
+        # 剩余工序少了一个阶段，最晚开始时间相应推后该阶段的预计耗时
+        now = datetime.utcnow()
+        values = {
+            TaskModel.stage: to_stage,
+            time_column: now,
+            TaskModel.version_id: TaskModel.version_id + 1,
+            TaskModel.priority_score: TaskModel.priority_score + TaskService.expected_stage_seconds(from_stage),
+            TaskModel.predicted_pickup_time: _predict_pickup(to_stage, now, refresh=False),
+        }
+        if to_stage == TaskStage.COMPLETED:
+            values[TaskModel.status] = '完成'
+        stmt = (
+            db.update(TaskModel)
+            .where(TaskModel.task_id == task_id,
+                   TaskModel.stage == from_stage,
+                   worker_column == worker_id)
+        )
+        if version_id is not None:
+            stmt = stmt.where(TaskModel.version_id == version_id)
+        # 开始煎药占用一个空闲槽位：锁定煎药锅行后确认有空闲槽位，并发开始时不会超出容量
+        pot_id = None
+        if action == 'decoction_start':
+            try:
+                pot_id = DecoctionService.reserve_pot()
+            except ValueError:
+                stmt = stmt.where(false())
+            if pot_id is not None:
+                values[TaskModel.pot_id] = pot_id
+                stmt = stmt.where(DecoctionService.slot_available(pot_id))
+        stmt = (
+            stmt
+            .values(values)
+            .execution_options(synchronize_session=False)
+        )
 
-        if task.status == '完成':
-            raise ValueError('任务已完成，无法继续更新状态!')
-
-        if action == 'receive' and task.receive_worker_id == worker_id and not task.receive_time:
-            task.receive_time = datetime.utcnow()
-        elif action == 'formulate' and task.form_worker_id == worker_id and task.receive_time and not task.form_time:
-            task.form_time = datetime.utcnow()
-        elif action == 'decoction_start' and task.decoction_worker_id == worker_id and task.form_time and not task.decoction_start_time:
-            task.decoction_start_time = datetime.utcnow()
-        elif action == 'decoction_end' and task.decoction_worker_id == worker_id and task.decoction_start_time and not task.decoction_end_time:
-            task.decoction_end_time = datetime.utcnow()
-            task.status = '完成'
+        # 支持 UPDATE ... RETURNING 的数据库（SQLite 3.35+、PostgreSQL）一次往返完成
+        if db.session.get_bind().dialect.update_returning:
+            row = db.session.execute(stmt.returning(*TRANSITION_RETURNING)).first()
         else:
+            row = None
+            if db.session.execute(stmt).rowcount == 1:
+                row = db.session.execute(
+                    db.select(*TRANSITION_RETURNING).where(TaskModel.task_id == task_id)
+                ).first()
+
+        if row is None:
+            current = db.session.execute(
+                db.select(TaskModel.stage, TaskModel.version_id, worker_column.label('worker_id'))
+                .where(TaskModel.task_id == task_id)
+            ).first()
+            if current is None:
+                raise ValueError('任务不存在!')
+            _check_version(current, version_id)
+            if current.stage == TaskStage.COMPLETED:
+                raise ValueError('任务已完成，无法继续更新状态!')
+            if action == 'decoction_start' and current.stage == from_stage and current.worker_id == worker_id:
+                raise ValueError(POTS_FULL_MESSAGE)
             raise ValueError('当前任务未满足操作条件，无法完成此操作。')
 
+        # 已加载到会话中的任务对象与数据库不再一致，下次访问时重新加载
+        task = db.session.identity_map.get(db.session.identity_key(TaskModel, task_id))
+        if task is not None:
+            db.session.expire(task)
+
+        _record_event(row, action, worker_id)
+        before = _capture(SimpleNamespace(**{**row._asdict(), 'stage': from_stage}))
+        after = _capture(row)
+        return before, after, row
+
+    @staticmethod
+    def update_task_status(task_id, worker_id, action, version_id=None):
+        """更新任务状态，返回更新后（含自动分配下一工序）的版本号
+
+        不满足条件时抛出 ValueError；提交了 version_id 且任务已被他人修改时抛出 TaskConflictError
+        """
+        _refresh_pickup_stats()
+        before, after, row = TaskService._apply_transition(task_id, worker_id, action, version_id)
         db.session.commit()
-        return task
+        _notify_task_changed(before, after)
+        assigned = _notify_stage_entered(row, action, worker_id)
+        return assigned.version_id if assigned else row.version_id
+
+    @staticmethod
+    def batch_update_task_status(worker_id, items):
+        """批量更新任务状态（如扫码枪一次扫描整盘任务）
+
+        逐条按 update_task_status 的规则以条件UPDATE应用，
+        所有成功的操作在同一事务中提交；失败的条目不影响其他条目。
+        同一任务可以在一批中出现多次（如先开始煎药再完成煎药），按顺序执行；
+        此时版本号只对该任务第一个成功的条目生效，之后的条目基于本批更新后的版本。
+
+        Args:
+            worker_id: 操作工人ID
+            items: [(task_id, action, version_id)]，version_id 可为 None
+
+        Returns:
+            list: 与 items 顺序一致的结果
+                {"task_id", "action", "success", "conflict", "message", "stage", "version_id"}
+        """
+        results = []
+        changes = []
+        batch_versions = {}
+        # 批内各条目的预测不再读取数据库，否则会读到本批之前条目未提交的更新
+        _refresh_pickup_stats()
+        for task_id, action, version_id in items:
+            result = {"task_id": task_id, "action": action, "success": False, "conflict": False,
+                      "stage": None, "version_id": None}
+            if version_id is not None:
+                version_id = batch_versions.get(task_id, version_id)
+            try:
+                before, after, row = TaskService._apply_transition(task_id, worker_id, action, version_id)
+            except TaskConflictError as e:
+                result.update(conflict=True, message=str(e))
+            except ValueError as e:
+                result["message"] = str(e)
+            else:
+                changes.append((before, after, row, result))
+                batch_versions[task_id] = row.version_id
+                result.update(success=True, message='任务状态更新成功!',
+                              stage=row.stage, version_id=row.version_id)
+            results.append(result)
+
+        if changes:
+            db.session.commit()
+            for before, after, row, result in changes:
+                _notify_task_changed(before, after)
+                assigned = _notify_stage_entered(row, result["action"], worker_id)
+                if assigned:
+                    result["version_id"] = assigned.version_id
+        return results
 
     @staticmethod
-    def rollback_task(task_id, phase):
-        """回退任务到指定阶段"""
+    def rollback_task(task_id, phase, version_id=None):
+        """回退任务到指定阶段
+
+        version_id 为客户端读取任务时的版本号，任务已被他人修改时抛出 TaskConflictError
+        """
         task = TaskModel.query.get_or_404(task_id)
+        _check_version(task, version_id)
+        _refresh_pickup_stats()
+        before = _capture(task)
 
-        if phase == 'receive' and task.receive_time:
+        # 回退到某阶段时，该阶段及之后阶段的完成时间一并清除
+        if phase == 'receive' and task.stage > TaskStage.RECEIVE:
             task.receive_time = None
             task.receive_worker_id = None
             task.receive_worker_name = None
+            task.form_time = None
+            task.decoction_start_time = None
+            task.pot_id = None
+            task.decoction_end_time = None
+            task.stage = TaskStage.RECEIVE
             task.status = '未完成'
-        elif phase == 'formulate' and task.form_time:
+        elif phase == 'formulate' and task.stage > TaskStage.FORMULATE:
             task.form_time = None
             task.form_worker_id = None
             task.form_worker_name = None
-        elif phase == 'decoction' and task.decoction_start_time:
             task.decoction_start_time = None
+            task.pot_id = None
+            task.decoction_end_time = None
+            task.stage = TaskStage.FORMULATE
+            task.status = '未完成'
+        elif phase == 'decoction' and task.stage > TaskStage.DECOCTION:
+            task.decoction_start_time = None
+            task.pot_id = None
             task.decoction_end_time = None
             task.decoction_worker_id = None
             task.decoction_worker_name = None
+            task.stage = TaskStage.DECOCTION
             task.status = '未完成'
         else:
             raise ValueError('无法回退到该阶段。')
 
-        db.session.commit()
+        if task.prescription:
+            task.priority_score = TaskService.priority_score(task.prescription, task.stage)
+        task.predicted_pickup_time = _predict_pickup(task.stage, refresh=False)
+        _record_event(task, f'rollback_{phase}')
+        after = _capture(task)
+        _commit_task_change()
+        _notify_task_changed(before, after)
+        # 回退清除了工人分配，负载无法增量推算，下次自动分配前重新对账
+        from services.assignment_service import assignment_engine
+        assignment_engine.invalidate()
         return task
 
+    @staticmethod
+    def expected_stage_seconds(stage):
+        """某阶段的预计耗时（秒）"""
+        minutes = current_app.config.get('STAGE_EXPECTED_MINUTES', {})
+        return 60 * minutes.get(STAGE_DURATION_KEYS.get(stage), 0)
+
+    @staticmethod
+    def priority_score(prescription, stage):
+        """任务优先级（EDF）：取药截止时间减去从该阶段到完成的预计耗时，即最晚开始时间
+
+        prescription 可以是处方对象或含 expected_pickup_time、date 的查询结果行；
+        未填写预计取药时间时按开方后 DEFAULT_PICKUP_HOURS 小时计。
+
+        Returns:
+            float: Unix 秒，越小越紧急
+        """
+        deadline = prescription.expected_pickup_time
+        if deadline is None:
+            hours = current_app.config.get('DEFAULT_PICKUP_HOURS', 24)
+            deadline = (prescription.date or datetime.utcnow()) + timedelta(hours=hours)
+        remaining = sum(TaskService.expected_stage_seconds(s) for s in range(stage, TaskStage.COMPLETED))
+        return deadline.replace(tzinfo=timezone.utc).timestamp() - remaining
+
     @staticmethod
     def get_task_status(task):
         """获取任务的当前状态"""
         if not task:
             return "未分配任务"
-        elif not task.receive_time:
-            return "待收方"
-        elif not task.form_time:
-            return "待配方"
-        elif not task.decoction_start_time:
-            return "待煎药"
-        elif not task.decoction_end_time:
-            return "煎药中"
-        else:
-            return "已完成"
+        return TaskStage.LABELS[task.stage]
 
     @staticmethod
     def get_phase_status(task):
         """获取任务的阶段状态"""
-        if task.decoction_end_time:
-            return "煎药已完成"
-        elif task.decoction_start_time:
-            return "煎药进行中"
-        elif task.form_time:
-            return "配方已完成，煎药未完成"
-        elif task.receive_time:
-            return "收方已完成，配方未完成"
-        else:
-            return "收方未完成"
+        return TaskStage.PHASE_LABELS[task.stage]
+
+    @staticmethod
+    def get_completed_counts_by_worker(since):
+        """统计每个工人自指定时间起参与完成的任务数
+
+        三个工人列合并后按 (task_id, worker_id) 去重再分组，一条查询得到所有工人的计数，
+        同一工人负责多个阶段的任务只计一次。
+
+        Returns:
+            dict: {worker_id: completed_count}，没有完成任务的工人不在其中
+        """
+        completed = (TaskModel.status == '完成', TaskModel.decoction_end_time >= since)
+        participations = union(*(
+            db.select(TaskModel.task_id, worker_column.label('worker_id')).where(
+                worker_column.isnot(None), *completed
+            )
+            for worker_column in (
+                TaskModel.receive_worker_id,
+                TaskModel.form_worker_id,
+                TaskModel.decoction_worker_id,
+            )
+        )).subquery()
+
+        rows = db.session.execute(
+            db.select(participations.c.worker_id, func.count())
+            .group_by(participations.c.worker_id)
+        ).all()
+        return {worker_id: count for worker_id, count in rows}
+
+    @staticmethod
+    def get_events_since(event_id=0, limit=1000):
+        """按 event_id 顺序读取高水位之后的任务事件
+
+        消费方保存已处理的最大 event_id，下次从该值继续读取，无需重新扫描任务表。
+        PostgreSQL 下并发事务可能晚于更大的 event_id 提交，对实时性要求高的消费方
+        可以保留一小段回看窗口。
+        """
+        return TaskEventModel.query.filter(
+            TaskEventModel.event_id > event_id
+        ).order_by(TaskEventModel.event_id).limit(limit).all()
+
+    @staticmethod
+    def get_task_board(stage=None, worker_id=None, sort='stage', cursor=None, limit=None):
+        """管理员任务看板：筛选、排序并按游标分页
+
+        游标为上一页最后一行的排序键，下一页直接从该键之后的索引位置继续读取。
+
+        Args:
+            stage: STAGE_FILTERS 中的键，None 表示全部
+            worker_id: 只返回该工人负责任一工序的任务
+            sort: BOARD_SORTS 中的键
+            cursor: 上一页返回的 next_cursor
+            limit: 每页条数，默认 TASK_BOARD_PAGE_SIZE
+
+        Returns:
+            dict: {"items": [TaskModel], "next_cursor": 下一页游标，没有下一页时为None}
+        """
+        if stage and stage not in STAGE_FILTERS:
+            raise ValueError('无效的阶段筛选!')
+        if sort not in BOARD_SORTS:
+            raise ValueError('无效的排序方式!')
+        limit = limit or current_app.config.get('TASK_BOARD_PAGE_SIZE', 50)
+        columns, direction = BOARD_SORTS[sort]
+
+        query = TaskModel.query
+        if stage:
+            query = query.filter(STAGE_FILTERS[stage][1])
+        if worker_id:
+            query = query.filter(or_(
+                TaskModel.receive_worker_id == worker_id,
+                TaskModel.form_worker_id == worker_id,
+                TaskModel.decoction_worker_id == worker_id
+            ))
+        if cursor:
+            try:
+                key = tuple(int(value) for value in cursor.split('_'))
+            except ValueError:
+                key = ()
+            if len(key) != len(columns):
+                raise ValueError('无效的分页参数!')
+            position = db.tuple_(*columns)
+            query = query.filter(position > key if direction == 'asc' else position < key)
+
+        order_by = [column.asc() if direction == 'asc' else column.desc() for column in columns]
+        tasks = query.order_by(*order_by).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(tasks) > limit:
+            tasks = tasks[:limit]
+            next_cursor = '_'.join(str(getattr(tasks[-1], column.key)) for column in columns)
+        return {"items": tasks, "next_cursor": next_cursor}
+
+    @staticmethod
+    def get_pending_action(task, worker_id):
+        """工人在该任务上的下一步操作（见 ACTION_LABELS），没有待办操作时返回None"""
+        for column, stage, action in WORKER_ACTIONS:
+            if task.stage == stage and getattr(task, column.key) == worker_id:
+                return action
+        return None
+
+    @staticmethod
+    def get_worker_queue(worker_id):
+        """工人当前待办队列：只包含当前阶段由该工人负责的任务
+
+        每个条件都命中 (工人列, stage, task_id) 索引，查询只读取进行中的任务，不随历史任务增长。
+        按优先级（最晚开始时间）排序，最紧急的在前。
+
+        Returns:
+            list: [(TaskModel, 待办操作)]
+        """
+        tasks = TaskModel.query.join(TaskModel.prescription).options(
+            contains_eager(TaskModel.prescription)
+        ).filter(or_(*(
+            and_(column == worker_id, TaskModel.stage == stage)
+            for column, stage, _ in WORKER_ACTIONS
+        ))).order_by(TaskModel.priority_score, TaskModel.task_id).all()
+        return [(task, TaskService.get_pending_action(task, worker_id)) for task in tasks]
+
+    @staticmethod
+    def get_worker_history(worker_id, cursor=None, limit=None):
+        """工人参与过的已完成任务，按 task_id 倒序游标分页
+
+        三个工人列分别按索引取出本页候选再合并，每页最多读取 3×limit 行索引，与历史总量无关。
+
+        Returns:
+            dict: {"items": [TaskModel], "next_cursor": 下一页游标，没有下一页时为None}
+        """
+        limit = limit or current_app.config.get('WORKER_HISTORY_PAGE_SIZE', 20)
+        if cursor:
+            try:
+                cursor = int(cursor)
+            except ValueError:
+                raise ValueError('无效的分页参数!')
+
+        # 各分支带 ORDER BY/LIMIT，需要包一层子查询才能 UNION
+        branches = [
+            db.select(TaskModel.task_id).where(
+                column == worker_id,
+                TaskModel.stage == TaskStage.COMPLETED,
+                *((TaskModel.task_id < cursor,) if cursor else ())
+            ).order_by(TaskModel.task_id.desc()).limit(limit + 1).subquery()
+            for column in WORKER_COLUMNS
+        ]
+        candidates = union(*(db.select(branch.c.task_id) for branch in branches)).subquery()
+
+        tasks = TaskModel.query.filter(
+            TaskModel.task_id.in_(db.select(candidates.c.task_id))
+        ).order_by(TaskModel.task_id.desc()).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(tasks) > limit:
+            tasks = tasks[:limit]
+            next_cursor = str(tasks[-1].task_id)
+        return {"items": tasks, "next_cursor": next_cursor}
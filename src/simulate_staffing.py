@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+排班离线模拟
+回放历史处方的到达时间，按历史数据估计各工序的处理时长分布，在不同排班方案下模拟
+收方 → 配方 → 煎药准备 → 煎煮 的排队过程，输出各工序排队任务数随时间的变化与逾期取药比例。
+
+各工序的处理时长取自工人的历史完成记录：同一工人相邻两次完成的间隔与任务进入该工序后的等待时间中
+较短者视为实际处理时长（排除排队等待），再截去最长的一部分（夜间、休息等非工作时间）。
+没有历史记录的工序按 STAGE_EXPECTED_MINUTES 取指数分布。时长一次性向量化抽样，
+同一随机种子下各方案使用相同的抽样结果，便于比较。
+
+依赖 NumPy（可选依赖，仅本脚本使用）：pip install numpy
+
+使用方法：python simulate_staffing.py [--days 90] [--plan plan.json] [--load 1.2] [--csv queue.csv]
+
+排班方案文件为方案列表，staff 中各工序为 8-18 时（本地时间）在岗的人数，或按时段 {"开始时-结束时": 人数}；
+pots 为煎药锅槽位总数（不写则使用已配置的煎药锅，未配置时不限）::
+
+    [
+        {"name": "当前排班", "staff": {"receive": 2, "formulate": 3, "decoction": 2}},
+        {"name": "配方加晚班", "staff": {"receive": 2, "formulate": {"8-18": 3, "18-22": 1}, "decoction": 2},
+         "pots": 6}
+    ]
+"""
+
+import argparse
+import csv
+import heapq
+import json
+import sys
+import time
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from flask import Flask
+from sqlalchemy import func
+from models import PrescriptionModel, TaskModel, DecoctionPotModel
+from exts import db, read_only
+from database import setup_database
+import config
+
+# 依次经过的工序：(键, 显示名称, STAGE_EXPECTED_MINUTES 键)；煎煮占用煎药锅而非工人
+STATIONS = (
+    ('receive', '收方', 'receive'),
+    ('formulate', '配方', 'formulate'),
+    ('decoction', '煎药准备', 'decoction'),
+    ('decocting', '煎煮', 'decocting'),
+)
+STAFFED = ('receive', 'formulate', 'decoction')
+
+# 整数人数的默认上班时段（本地时间，时）
+DEFAULT_HOURS = (8, 18)
+
+# 最后一张处方到达后继续模拟的天数，仍未完成的任务计为逾期
+DRAIN_DAYS = 14
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+# 排队汇总表的列宽（按终端显示宽度计，中文字符占两列）
+DATE_WIDTH = 12
+COLUMN_WIDTH = 10
+
+
+def create_app():
+    """创建Flask应用"""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    return app
+
+
+def _seconds(values):
+    """datetime 列表转为 Unix 秒数组，空值为 NaN"""
+    stamps = np.array(values, dtype='datetime64[us]')
+    result = (stamps - np.datetime64(0, 'us')) / np.timedelta64(1, 's')
+    result[np.isnat(stamps)] = np.nan
+    return result
+
+
+def _datetime(stamp, utc_offset=0):
+    return datetime(1970, 1, 1) + timedelta(seconds=float(stamp), hours=utc_offset)
+
+
+def _tz_label(utc_offset):
+    return f'UTC{utc_offset:+d}' if utc_offset else 'UTC'
+
+
+def _pad(text, width, left=False):
+    """按终端显示宽度补齐到 width 列（默认右对齐）"""
+    shown = sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1 for c in text)
+    padding = ' ' * max(width - shown, 0)
+    return text + padding if left else padding + text
+
+
+def _ids(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+@read_only()
+def load_history(days):
+    """读取最近 days 天开具的处方及其任务的各工序完成时间"""
+    latest = db.session.query(func.max(PrescriptionModel.date)).scalar()
+    if latest is None:
+        return None
+    since = latest - timedelta(days=days)
+    rows = db.session.query(
+        PrescriptionModel.date, PrescriptionModel.expected_pickup_time,
+        TaskModel.receive_time, TaskModel.receive_worker_id,
+        TaskModel.form_time, TaskModel.form_worker_id,
+        TaskModel.decoction_start_time, TaskModel.decoction_worker_id,
+        TaskModel.decoction_end_time,
+    ).outerjoin(TaskModel, TaskModel.prescription_id == PrescriptionModel.prescription_id).filter(
+        PrescriptionModel.date >= since
+    ).order_by(PrescriptionModel.date).all()
+
+    columns = list(zip(*rows))
+    pots = db.session.query(func.sum(DecoctionPotModel.slots)).filter(
+        DecoctionPotModel.is_active.is_(True)
+    ).scalar()
+    return {
+        'arrival': _seconds(columns[0]),
+        'pickup': _seconds(columns[1]),
+        'receive': (_seconds(columns[0]), _seconds(columns[2]), _ids(columns[3])),
+        'formulate': (_seconds(columns[2]), _seconds(columns[4]), _ids(columns[5])),
+        'decoction': (_seconds(columns[4]), _seconds(columns[6]), _ids(columns[7])),
+        'decocting': (_seconds(columns[6]), _seconds(columns[8]), None),
+        'pots': pots,
+    }
+
+
+def service_samples(entered, done, workers, clip_quantile):
+    """按工人的完成记录估计处理时长样本（秒）
+
+    处理开始时间取「任务进入该工序」与「该工人上一次完成」中较晚者；workers 为空时（煎煮）直接取两者之差。
+    """
+    valid = ~np.isnan(entered) & ~np.isnan(done) & (done >= entered)
+    if workers is None:
+        samples = done[valid] - entered[valid]
+    else:
+        valid &= ~np.isnan(workers)
+        entered, done, workers = entered[valid], done[valid], workers[valid]
+        order = np.lexsort((done, workers))
+        entered, done, workers = entered[order], done[order], workers[order]
+        previous = np.full_like(done, -np.inf)
+        previous[1:] = np.where(workers[1:] == workers[:-1], done[:-1], -np.inf)
+        samples = done - np.maximum(entered, previous)
+    if samples.size and clip_quantile < 1:
+        samples = samples[samples <= np.quantile(samples, clip_quantile)]
+    return samples
+
+
+def sample_durations(rng, samples, expected_minutes, size):
+    """有历史样本时有放回地重抽样，否则按预计耗时取指数分布"""
+    if samples.size:
+        return rng.choice(samples, size=size)
+    return rng.exponential(expected_minutes * 60, size=size)
+
+
+def capacity_steps(staff, start, end, utc_offset):
+    """把排班换算为 [start, end) 内的阶梯容量：(变化时刻数组, 人数数组)"""
+    if isinstance(staff, int):
+        staff = {f'{DEFAULT_HOURS[0]}-{DEFAULT_HOURS[1]}': staff}
+    by_hour = np.zeros(24, dtype=int)
+    for span, count in staff.items():
+        begin, finish = (int(h) for h in span.split('-'))
+        hours = np.arange(begin, finish if finish > begin else finish + 24) % 24
+        by_hour[hours] = count
+
+    first = np.floor(start / HOUR) * HOUR
+    hour_starts = np.arange(first, end + HOUR, HOUR)
+    local_hours = ((hour_starts / HOUR).astype(np.int64) + utc_offset) % 24
+    counts = by_hour[local_hours]
+    changes = np.concatenate(([0], np.flatnonzero(np.diff(counts)) + 1))
+    return hour_starts[changes], counts[changes]
+
+
+def simulate_station(arrivals, deadlines, durations, steps):
+    """多人工序的非抢占排队：空闲人员按取药截止时间从最早的排队任务开始处理（与工人待办队列的优先级一致）
+
+    Args:
+        steps: capacity_steps 的结果；为 None 时不限人数
+
+    Returns:
+        (开始时间, 完成时间)：模拟期内未能开始的任务为 inf
+    """
+    if steps is None:
+        return arrivals.copy(), arrivals + durations
+
+    change_times, counts = steps
+    n = arrivals.size
+    starts = np.full(n, np.inf)
+    ends = np.full(n, np.inf)
+    order = np.argsort(arrivals, kind='stable')
+    waiting, running = [], []
+    i, step = 0, 0
+    while True:
+        next_arrival = arrivals[order[i]] if i < n else np.inf
+        next_done = running[0] if running else np.inf
+        next_change = change_times[step + 1] if step + 1 < change_times.size else np.inf
+        now = min(next_arrival, next_done, next_change)
+        if now == np.inf or (i >= n and not waiting):
+            break
+
+        while running and running[0] <= now:
+            heapq.heappop(running)
+        while step + 1 < change_times.size and change_times[step + 1] <= now:
+            step += 1
+        while i < n and arrivals[order[i]] <= now:
+            heapq.heappush(waiting, (deadlines[order[i]], order[i]))
+            i += 1
+
+        while waiting and len(running) < counts[step]:
+            _, task = heapq.heappop(waiting)
+            starts[task] = now
+            ends[task] = now + durations[task]
+            heapq.heappush(running, ends[task])
+    return starts, ends
+
+
+def queue_lengths(arrivals, starts, times):
+    """各时刻已到达但尚未开始处理的任务数"""
+    return (np.searchsorted(np.sort(arrivals), times, side='right')
+            - np.searchsorted(np.sort(starts), times, side='right'))
+
+
+def run_scenario(scenario, history, samples, args, app_config):
+    """模拟一个排班方案，返回汇总指标与按小时的排队序列"""
+    rng = np.random.default_rng(args.seed)
+
+    # 按负载倍数回放到达：每张历史处方按泊松分布重复，保留其到达时间与取药截止时长
+    copies = rng.poisson(args.load, history['arrival'].size) if args.load != 1 else 1
+    arrivals = np.repeat(history['arrival'], copies)
+    default_pickup = app_config['DEFAULT_PICKUP_HOURS'] * HOUR
+    allowed = np.repeat(np.nan_to_num(history['pickup'] - history['arrival'], nan=default_pickup), copies)
+    deadlines = arrivals + allowed
+
+    start, end = arrivals.min(), arrivals.max() + DRAIN_DAYS * DAY
+    pots = scenario.get('pots', history['pots'])
+    stations = {}
+    entering = arrivals
+    for key, _, expected_key in STATIONS:
+        durations = sample_durations(rng, samples[key], app_config['STAGE_EXPECTED_MINUTES'][expected_key],
+                                     arrivals.size)
+        if key == 'decocting':
+            steps = (np.array([start]), np.array([pots])) if pots else None
+        else:
+            steps = capacity_steps(scenario['staff'][key], start, end, args.utc_offset)
+        starts, ends = simulate_station(entering, deadlines, durations, steps)
+        stations[key] = (entering, starts)
+        entering = ends
+
+    finished = entering
+    times = np.arange(np.floor(start / HOUR) * HOUR, arrivals.max() + DAY, HOUR)
+    series = {key: queue_lengths(entered, starts, times) for key, (entered, starts) in stations.items()}
+    series['wip'] = queue_lengths(arrivals, finished, times)
+
+    done = np.isfinite(finished)
+    lead_hours = (finished[done] - arrivals[done]) / HOUR
+    return {
+        'name': scenario['name'],
+        'prescriptions': arrivals.size,
+        'late_pct': 100.0 * np.mean(finished > deadlines),
+        'unfinished': int((~done).sum()),
+        'lead_mean': float(lead_hours.mean()) if lead_hours.size else float('nan'),
+        'lead_p95': float(np.quantile(lead_hours, 0.95)) if lead_hours.size else float('nan'),
+        'times': times,
+        'series': series,
+    }
+
+
+def default_scenarios(history):
+    """未提供排班方案文件时：按历史中参与各工序的工人数，以及各工序各加一人"""
+    current = {}
+    for key in STAFFED:
+        workers = history[key][2]
+        current[key] = max(int(np.unique(workers[~np.isnan(workers)]).size), 1)
+    return [
+        {'name': '历史人数', 'staff': current},
+        {'name': '各工序加一人', 'staff': {key: count + 1 for key, count in current.items()}},
+    ]
+
+
+def print_report(result, report_days, utc_offset):
+    print(f"=== {result['name']} ===")
+    print(f"处方数 {result['prescriptions']}，逾期取药 {result['late_pct']:.1f}%，"
+          f"平均完成用时 {result['lead_mean']:.1f} 小时，95% 分位 {result['lead_p95']:.1f} 小时，"
+          f"模拟期内未完成 {result['unfinished']}")
+    print(f"排队任务数（每 {report_days} 天内的最大值，周期起始为 {_tz_label(utc_offset)} 时间）:")
+    headers = [label for _, label, _ in STATIONS] + ['在制合计']
+    print('  ' + _pad('周期起始', DATE_WIDTH, left=True) + ''.join(_pad(h, COLUMN_WIDTH) for h in headers))
+
+    period = report_days * 24
+    keys = [key for key, _, _ in STATIONS] + ['wip']
+    for offset in range(0, result['times'].size, period):
+        begin = _datetime(result['times'][offset], utc_offset)
+        peaks = [int(result['series'][key][offset:offset + period].max()) for key in keys]
+        print('  ' + _pad(f"{begin:%Y-%m-%d}", DATE_WIDTH, left=True) + ''.join(_pad(str(p), COLUMN_WIDTH) for p in peaks))
+    print()
+
+
+def write_csv(path, results, utc_offset):
+    """按小时输出各方案的排队序列，时间与控制台汇总使用同一时区，并带时差（如 2024-01-01T08:00:00+08:00）"""
+    keys = [key for key, _, _ in STATIONS] + ['wip']
+    tz = timezone(timedelta(hours=utc_offset))
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['scenario', 'time'] + keys)
+        for result in results:
+            for i, stamp in enumerate(result['times']):
+                writer.writerow([result['name'], _datetime(stamp, utc_offset).replace(tzinfo=tz).isoformat()]
+                                + [int(result['series'][key][i]) for key in keys])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='排班离线模拟：回放历史处方，比较不同排班下的排队与逾期取药比例')
+    parser.add_argument('--days', type=int, default=90, help='回放最近多少天的处方（默认 90）')
+    parser.add_argument('--plan', help='排班方案 JSON 文件，不提供时比较历史人数与各工序加一人')
+    parser.add_argument('--load', type=float, default=1.0, help='到达量倍数，如 1.2 表示处方量增加 20%%')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子（各方案共用）')
+    parser.add_argument('--clip-quantile', type=float, default=0.95,
+                        help='处理时长样本截去该分位以上的部分（排除非工作时间，默认 0.95）')
+    parser.add_argument('--utc-offset', type=int,
+                        default=int(datetime.now().astimezone().utcoffset().total_seconds() // 3600),
+                        help='排班时段所用时区与 UTC 的时差（小时，默认本机时区）')
+    parser.add_argument('--report-days', type=int, default=7, help='排队汇总的周期天数（默认 7）')
+    parser.add_argument('--csv', help='按小时输出排队序列的 CSV 文件')
+    args = parser.parse_args()
+
+    if np is None:
+        print('排班模拟需要 NumPy，请先安装：pip install numpy')
+        return 1
+
+    app = create_app()
+    setup_database(app)
+    with app.app_context():
+        history = load_history(args.days)
+    if history is None:
+        print('没有可回放的历史处方')
+        return 1
+
+    samples = {
+        key: service_samples(*history[key], args.clip_quantile if history[key][2] is not None else 1)
+        for key, _, _ in STATIONS
+    }
+    for key, label, _ in STATIONS:
+        if samples[key].size:
+            print(f"{label}处理时长：{samples[key].size} 个样本，中位数 {np.median(samples[key]) / 60:.1f} 分钟")
+        else:
+            print(f"{label}处理时长：无历史样本，按预计耗时 {app.config['STAGE_EXPECTED_MINUTES'][key]} 分钟")
+    print()
+
+    if args.plan:
+        with open(args.plan, encoding='utf-8') as f:
+            scenarios = json.load(f)
+    else:
+        scenarios = default_scenarios(history)
+
+    results = []
+    for scenario in scenarios:
+        began = time.perf_counter()
+        result = run_scenario(scenario, history, samples, args, app.config)
+        print(f"（模拟用时 {time.perf_counter() - began:.2f} 秒）")
+        print_report(result, args.report_days, args.utc_offset)
+        results.append(result)
+
+    print('方案对比:')
+    for result in results:
+        print(f"  {result['name']:<16} 逾期取药 {result['late_pct']:5.1f}%  "
+              f"在制峰值 {int(result['series']['wip'].max()):>6}  平均完成用时 {result['lead_mean']:.1f} 小时")
+
+    if args.csv:
+        write_csv(args.csv, results, args.utc_offset)
+        print(f"排队序列已写入 {args.csv}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
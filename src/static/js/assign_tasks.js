@@ -1,66 +1,185 @@
-const rowsPerPage = 5;
-const rows = document.querySelectorAll(".task-row");
-const pagination = document.getElementById("pagination");
+// 任务看板：按筛选条件从 /admin/tasks/board 分页加载，"加载更多"使用上一页返回的游标
+let nextCursor = null;
+let loading = false;
+
+// 与 TaskStage 取值一致
+const STAGE_COMPLETED = 4;
+
+function escapeHtml(value) {
+  return String(value ?? "")
+    .replace(/&/g, "&amp;")
+    .replace(/</g, "&lt;")
+    .replace(/>/g, "&gt;")
+    .replace(/"/g, "&quot;");
+}
 
-function displayPage(page) {
-  const start = (page - 1) * rowsPerPage;
-  const end = start + rowsPerPage;
+function workerCell(name, workerId, done) {
+  const state = done ? "completed" : workerId ? "uncompleted" : "unassigned";
+  return `<td style="text-align: center;">
+    <span class="worker-name ${state}">${escapeHtml(name || "未分配")}</span>
+  </td>`;
+}
 
-  rows.forEach((row, index) => {
-    row.style.display = index >= start && index < end ? "" : "none";
-  });
+function operationCell(task) {
+  if (task.stage === STAGE_COMPLETED) {
+    return '<td style="text-align: center;"><span>任务已完成</span></td>';
+  }
+
+  const workerOptions = WORKERS.map(
+    (w) =>
+      `<option value="${w.worker_id}" style="color: #000000;">${escapeHtml(w.name)}</option>`
+  ).join("");
+  const selectStyle =
+    "width: 90px; height: 28px; font-size: 12px; color: #000000; background-color: #ffffff; border: 1px solid #cbd5e1; border-radius: 4px;";
+
+  return `<td style="text-align: center;">
+    <div style="display: flex; align-items: center; gap: 8px; justify-content: center; flex-wrap: wrap;">
+      <form method="POST" action="/admin/assign_tasks" style="margin: 0; display: flex; gap: 5px; align-items: center;">
+        <input type="hidden" name="task_id" value="${task.task_id}">
+        <input type="hidden" name="version_id" value="${task.version_id}">
+        <input type="hidden" name="operation" value="assign">
+        <select name="task_type" style="${selectStyle}" required>
+          <option value="" selected disabled style="color: #666;">选择工序</option>
+          <option value="receive" ${task.receive_time ? "disabled" : ""} style="color: #000000;">收方</option>
+          <option value="formulate" ${task.form_time ? "disabled" : ""} style="color: #000000;">配方</option>
+          <option value="decoction" ${task.decoction_end_time ? "disabled" : ""} style="color: #000000;">煎药</option>
+        </select>
+        <select name="worker_id" style="${selectStyle}" required>
+          <option value="" selected disabled style="color: #666;">选择工人</option>
+          ${workerOptions}
+        </select>
+        <button type="submit" style="font-size: 12px; padding: 4px 12px; height: 28px; white-space: nowrap;">分配</button>
+      </form>
+      <button class="small-button"
+        style="background-color: #dc2626; color: white; border: none; padding: 4px 12px; cursor: pointer; height: 28px; font-size: 12px; border-radius: 4px;"
+        data-task-id="${task.task_id}" data-stage="${task.stage}" data-version-id="${task.version_id}"
+        onclick="openRollbackModal(this)">回退</button>
+    </div>
+  </td>`;
 }
 
-function setupPagination() {
-  const totalPages = Math.ceil(rows.length / rowsPerPage);
-  pagination.innerHTML = "";
-
-  for (let i = 1; i <= totalPages; i++) {
-    const button = document.createElement("button");
-    button.textContent = i;
-    button.className = i === 1 ? "active" : "";
-    button.addEventListener("click", () => {
-      document
-        .querySelector(".pagination button.active")
-        .classList.remove("active");
-      button.classList.add("active");
-      displayPage(i);
-    });
-    pagination.appendChild(button);
+function renderTask(task) {
+  return `<tr class="task-row" style="height: 60px;">
+    <td style="text-align: center;">${task.task_id}</td>
+    <td style="text-align: center;">${task.prescription_id ?? ""}</td>
+    <td style="text-align: center;">${escapeHtml(task.phase_status)}</td>
+    ${workerCell(task.receive_worker_name, task.receive_worker_id, task.receive_time)}
+    ${workerCell(task.form_worker_name, task.form_worker_id, task.form_time)}
+    ${workerCell(task.decoction_worker_name, task.decoction_worker_id, task.decoction_end_time)}
+    ${operationCell(task)}
+  </tr>`;
+}
+
+function currentFilters() {
+  return {
+    stage: document.getElementById("stageFilter").value,
+    worker_id: document.getElementById("workerFilter").value,
+    sort: document.getElementById("sortSelect").value,
+  };
+}
+
+async function loadTasks(reset) {
+  if (loading) return;
+  loading = true;
+
+  const table = document.getElementById("taskTable");
+  const loadMoreButton = document.getElementById("loadMoreButton");
+  const params = new URLSearchParams();
+  for (const [key, value] of Object.entries(currentFilters())) {
+    if (value) params.set(key, value);
+  }
+  if (!reset && nextCursor) params.set("cursor", nextCursor);
+
+  try {
+    const response = await fetch(`${TASK_BOARD_URL}?${params}`);
+    const data = await response.json();
+    if (!data.success) {
+      alert(data.message);
+      return;
+    }
+
+    if (reset) table.innerHTML = "";
+    table.insertAdjacentHTML("beforeend", data.tasks.map(renderTask).join(""));
+    if (reset && data.tasks.length === 0) {
+      table.innerHTML =
+        '<tr><td colspan="7" style="text-align: center;">没有符合条件的任务</td></tr>';
+    }
+
+    nextCursor = data.next_cursor;
+    loadMoreButton.style.display = nextCursor ? "" : "none";
+  } catch (error) {
+    console.error("Error:", error);
+    alert("任务加载失败，请重试");
+  } finally {
+    loading = false;
   }
 }
 
-displayPage(1);
-setupPagination();
+// 筛选条件保存在地址栏中，操作后刷新页面仍保持当前筛选
+function saveFiltersToUrl() {
+  const params = new URLSearchParams();
+  for (const [key, value] of Object.entries(currentFilters())) {
+    if (value) params.set(key, value);
+  }
+  const query = params.toString();
+  history.replaceState(null, "", query ? `?${query}` : location.pathname);
+}
+
+function restoreFiltersFromUrl() {
+  const params = new URLSearchParams(location.search);
+  if (params.get("stage")) document.getElementById("stageFilter").value = params.get("stage");
+  if (params.get("worker_id")) document.getElementById("workerFilter").value = params.get("worker_id");
+  if (params.get("sort")) document.getElementById("sortSelect").value = params.get("sort");
+}
+
+// 自动分配：先获取分配计划供确认，确认后再执行
+const PHASE_LABELS = { receive: "收方", formulate: "配方", decoction: "煎药" };
+
+async function autoAssign() {
+  try {
+    const plan = await (await fetch(AUTO_ASSIGN_URL)).json();
+    if (plan.assignments.length === 0) {
+      alert("没有需要分配的任务");
+      return;
+    }
+
+    const preview = plan.assignments
+      .slice(0, 10)
+      .map((a) => `任务 ${a.task_id} ${PHASE_LABELS[a.phase]} → ${a.worker_name}`)
+      .join("\n");
+    const more = plan.assignments.length > 10 ? `\n……共 ${plan.assignments.length} 项` : "";
+    if (!confirm(`将自动分配以下任务：\n${preview}${more}`)) return;
+
+    const result = await (await fetch(AUTO_ASSIGN_URL, { method: "POST" })).json();
+    const succeeded = result.assignments.filter((a) => a.success).length;
+    alert(`已分配 ${succeeded} 项，失败 ${result.assignments.length - succeeded} 项`);
+    loadTasks(true);
+  } catch (error) {
+    console.error("Error:", error);
+    alert("自动分配失败，请重试");
+  }
+}
 
 function openRollbackModal(button) {
   const taskId = button.getAttribute("data-task-id");
-  const receiveCompleted =
-    button.getAttribute("data-receive-completed") === "true";
-  const formCompleted = button.getAttribute("data-form-completed") === "true";
-  const decoctionStarted =
-    button.getAttribute("data-decoction-started") === "true";
-  const decoctionEnded = button.getAttribute("data-decoction-ended") === "true";
+  const stage = Number(button.getAttribute("data-stage"));
 
   document.getElementById("rollbackModal").style.display = "block";
   document.getElementById("rollbackTaskId").value = taskId;
+  document.getElementById("rollbackVersionId").value = button.getAttribute("data-version-id");
 
+  // 只能回退到当前阶段之前的工序（取值与 TaskStage 一致：收方0、配方1、煎药2）
   const rollbackPhase = document.getElementById("rollback_phase");
   rollbackPhase.innerHTML = "";
 
-  if (decoctionEnded) {
-    rollbackPhase.innerHTML +=
-      '<option value="decoction_end">煎药结束</option>';
+  if (stage > 2) {
+    rollbackPhase.innerHTML += '<option value="decoction">煎药前</option>';
   }
-  if (decoctionStarted) {
-    rollbackPhase.innerHTML +=
-      '<option value="decoction_start">煎药开始</option>';
+  if (stage > 1) {
+    rollbackPhase.innerHTML += '<option value="formulate">配方前</option>';
   }
-  if (formCompleted) {
-    rollbackPhase.innerHTML += '<option value="formulate">配方</option>';
-  }
-  if (receiveCompleted) {
-    rollbackPhase.innerHTML += '<option value="receive">收方</option>';
+  if (stage > 0) {
+    rollbackPhase.innerHTML += '<option value="receive">收方前</option>';
   }
 
   if (rollbackPhase.innerHTML === "") {
@@ -74,6 +193,20 @@ function closeRollbackModal() {
 
 // 监听表单提交 - 使用事件委托确保动态加载的表单也能被捕获
 document.addEventListener("DOMContentLoaded", function () {
+  restoreFiltersFromUrl();
+  loadTasks(true);
+
+  for (const id of ["stageFilter", "workerFilter", "sortSelect"]) {
+    document.getElementById(id).addEventListener("change", () => {
+      saveFiltersToUrl();
+      loadTasks(true);
+    });
+  }
+  document
+    .getElementById("loadMoreButton")
+    .addEventListener("click", () => loadTasks(false));
+  document.getElementById("autoAssignButton").addEventListener("click", autoAssign);
+
   document.addEventListener("submit", async (e) => {
     // 检查是否是任务分配相关的表单
     if (e.target.matches('form[action*="assign_tasks"]')) {
@@ -90,7 +223,12 @@ document.addEventListener("DOMContentLoaded", function () {
 
         const data = await response.json(); // 解析返回的 JSON 数据
 
-        if (data.success) {
+        if (response.status === 409) {
+          // 任务已被他人修改：提示后重新加载看板，取得最新状态与版本号
+          alert(data.message);
+          closeRollbackModal();
+          loadTasks(true);
+        } else if (data.success) {
           // 成功提示
           alert(data.message);
           location.reload(); // 刷新页面，显示新的分配状态
@@ -70,6 +70,10 @@ function updateDashboard(data) {
         document.getElementById('completed-today').textContent = data.metrics.completed_today || 0;
     }
 
+    if (data.backlog) {
+        updateBacklogCard(data.backlog);
+    }
+
     // 更新图表
     if (data.stage_distribution) {
         updateStageChart(data.stage_distribution);
@@ -79,6 +83,10 @@ function updateDashboard(data) {
         updateWorkerChart(data.worker_efficiency);
     }
 
+    if (data.assignment_status) {
+        updateWipTable(data.assignment_status);
+    }
+
     if (data.hourly_stats) {
         updateTrendChart(data.hourly_stats);
     }
@@ -91,6 +99,27 @@ function updateDashboard(data) {
     }
 }
 
+// 更新积压清空预估：超过SLA或无法清空时标红
+function updateBacklogCard(backlog) {
+    const labels = {receive: '收方', formulate: '配方', decoction: '煎药'};
+    document.getElementById('backlog-drain').textContent =
+        backlog.stalled ? '无法清空' : `${Math.round(backlog.drain_minutes)} 分钟`;
+
+    let detail = `SLA ${Math.round(backlog.sla_minutes)} 分钟 · 到达 ${backlog.arrival_rate.toFixed(1)} 单/小时`;
+    if (backlog.bottleneck) {
+        const phase = backlog.phases[backlog.bottleneck];
+        detail += ` · 瓶颈${labels[backlog.bottleneck]} ${phase.service_rate.toFixed(1)} 单/小时`;
+        if (phase.rate_source === 'expected') {
+            detail += '（样本不足，按预计耗时）';
+        }
+        if (backlog.growing) {
+            detail += '（积压增长中）';
+        }
+    }
+    document.getElementById('backlog-detail').textContent = detail;
+    document.getElementById('backlog-card').classList.toggle('backlog-breached', backlog.breached);
+}
+
 // 更新阶段分布饼图
 function updateStageChart(distribution) {
     const ctx = document.getElementById('stageChart').getContext('2d');
@@ -195,6 +224,38 @@ function updateWorkerChart(efficiency) {
     }
 }
 
+// 更新工序排队与在制任务上限表格（所有工人都已达上限时，排队任务需等待工人完成手头任务）
+function updateWipTable(status) {
+    const phases = [['receive', '收方'], ['formulate', '配方'], ['decoction', '煎药']];
+    const tbody = document.getElementById('wip-table-body');
+    tbody.innerHTML = '';
+
+    phases.forEach(([key, label]) => {
+        const s = status[key];
+        if (!s) {
+            return;
+        }
+        const saturated = s.workers > 0 && s.at_limit >= s.workers;
+        const row = document.createElement('tr');
+        if (saturated) {
+            row.className = 'wip-saturated';
+        }
+        [
+            label,
+            saturated ? `${s.waiting}（工人已满，等待中）` : s.waiting,
+            s.open,
+            s.limit || '不限制',
+            `${s.at_limit} / ${s.workers}`,
+            s.rejected_today
+        ].forEach(value => {
+            const cell = document.createElement('td');
+            cell.textContent = value;
+            row.appendChild(cell);
+        });
+        tbody.appendChild(row);
+    });
+}
+
 // 更新趋势折线图
 function updateTrendChart(stats) {
     const ctx = document.getElementById('trendChart').getContext('2d');